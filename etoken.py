@@ -15,6 +15,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+from sys import intern
+
 
 class EToken():
     """One token in the string being parsed.
@@ -37,6 +39,12 @@ class EToken():
            DURATION
            IGN  (means "should be ignored")
            - (means "unknown")
+    .time
+        For tokens representing a time, a norm_values.TimeValue;
+        otherwise None
+    .date
+        For tokens representing a date, a norm_values.DateValue;
+        otherwise None
 
     Here is the current table of .pos (part-of-speech) values:
 
@@ -76,15 +84,37 @@ class EToken():
         WP	wh-pronoun	who, what
         WP$	possessive wh-pronoun	whose
         WRB	wh-abverb	where, when
+
+    We create a great many tokens, so EToken uses __slots__ rather
+    than a per-instance __dict__. The .pos and .sem strings passed to
+    the constructor are interned (the tags from the tagger would not
+    otherwise be), and the values assigned elsewhere in the parser are
+    string literals, which Python interns already. So comparisons
+    against these attributes, whether by == or by membership in a list
+    of literals, normally succeed on identity without comparing
+    characters.
     """
 
+    __slots__ = ("orig", "val", "pos", "sem", "_time", "_date")
+
     def __init__(self, orig_str: str, pos: str, sem: str = "-"):
         self.orig = orig_str
         self.val = orig_str.lower()
-        self.pos = pos
-        self.sem = sem
-        self._time = None  # filled in for date tokens
-        self._date = None  # filled in for time tokens
+        self.pos = intern(pos)
+        self.sem = intern(sem)
+        self._time = None  # filled in for time tokens
+        self._date = None  # filled in for date tokens
+
+    def copy(self):
+        """Return a new token with the same attributes as this one"""
+        tok = EToken.__new__(EToken)
+        tok.orig = self.orig
+        tok.val = self.val
+        tok.pos = self.pos
+        tok.sem = self.sem
+        tok._time = self._time
+        tok._date = self._date
+        return tok
 
     def __repr__(self):
         if self._time:
@@ -93,8 +123,8 @@ class EToken():
             return(f"{self._date}({self.sem})")
         return (f"{self.val}({self.sem},{self.pos})")
 
-    time_sems = ["TIME", "ST_TIME", "END_TIME"]
-    date_sems = ["DATE", "ST_DATE", "END_DATE"]
+    time_sems = ("TIME", "ST_TIME", "END_TIME")
+    date_sems = ("DATE", "ST_DATE", "END_DATE")
 
     @property
     def time(self):
@@ -120,30 +150,29 @@ class EToken():
         """If this token matches all the supplied values, return True.
 
         val, pos, and sem can all be either None (matches everything),
-        a single string (must match), a list of strings (must match
-        one element on the list), or a dict (must be one of the keys
-        in the dict).
+        a single string (must match), or a collection of strings such
+        as a list, set or dict (must be one of its elements or keys).
         """
-        if type(val) is str and self.val != val:
-            return False
-        if type(val) is list and self.val not in val:
-            return False
-        if type(val) is dict and self.val not in val:
-            return False
-
-        if type(pos) is str and self.pos != pos:
-            return False
-        if type(pos) is list and self.pos not in pos:
-            return False
-        if type(pos) is dict and self.pos not in pos:
-            return False
-
-        if type(sem) is str and self.sem != sem:
-            return False
-        if type(sem) is list and self.sem not in sem:
-            return False
-        if type(sem) is dict and self.sem not in sem:
-            return False
+        if val is not None:
+            if val.__class__ is str:
+                if self.val != val:
+                    return False
+            elif self.val not in val:
+                return False
+
+        if pos is not None:
+            if pos.__class__ is str:
+                if self.pos is not pos and self.pos != pos:
+                    return False
+            elif self.pos not in pos:
+                return False
+
+        if sem is not None:
+            if sem.__class__ is str:
+                if self.sem is not sem and self.sem != sem:
+                    return False
+            elif self.sem not in sem:
+                return False
 
         return True
 
@@ -152,6 +181,9 @@ class ETokenNull():
     """EToken lookalike that it has no contents and its match function
     always returns False. Convenient for parsing.
     """
+
+    __slots__ = ("orig", "val", "pos", "sem", "time", "date")
+
     def __init__(self):
         self.orig = "NULL"
         self.val = "NULL"
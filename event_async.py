@@ -0,0 +1,148 @@
+# event_async.py: Parse calendar event phrases from asyncio code
+#
+# Copyright (C) 2018 Cardinal Peak LLC
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import event_parser
+import event_pool
+
+
+def process_executor(processes: int = None,
+                     tagger: str = None) -> ProcessPoolExecutor:
+    """Return a process pool executor whose workers have loaded the
+    tokenizer and the named tagger engine before their first parse.
+
+    Worker processes avoid holding the event loop's process to one
+    CPU for tagging, at the cost of sending phrases and results
+    between processes.
+    """
+    return ProcessPoolExecutor(processes, initializer=event_pool.init_worker,
+                               initargs=(tagger,))
+
+
+class AsyncParser():
+    """Runs event_parser on an executor, so that parsing never blocks
+    the event loop.
+
+    executor is a concurrent.futures executor: None for the event
+    loop's default thread pool, a ThreadPoolExecutor, or a process
+    pool such as process_executor() returns. The caller owns the
+    executor and shuts it down.
+
+    max_concurrency caps the number of parses (or batches, for
+    parse_events()) submitted to the executor at once; other callers
+    wait their turn without holding up the loop. None means no cap
+    beyond the executor's own. An AsyncParser may be used from more
+    than one event loop, as by successive asyncio.run() calls; the
+    cap applies to each loop separately.
+
+    Cancelling a waiting call withdraws it before it reaches the
+    executor. A parse already running in a worker is left to finish,
+    but its result is discarded.
+    """
+
+    def __init__(self, executor=None, max_concurrency: int = None,
+                 tagger: str = None):
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self.tagger = tagger
+        # a semaphore for each running loop, as one is bound to the
+        # loop it is first used in
+        self.semaphores = weakref.WeakKeyDictionary()
+
+    async def run(self, func, *args):
+        """Run func(*args) on the executor, within the concurrency cap,
+        and return its result."""
+        loop = asyncio.get_running_loop()
+        if self.max_concurrency is None:
+            return await loop.run_in_executor(self.executor,
+                                              partial(func, *args))
+        semaphore = self.semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.semaphores[loop] = semaphore
+        async with semaphore:
+            return await loop.run_in_executor(self.executor,
+                                              partial(func, *args))
+
+    async def parse_event(self, raw: str, debug: bool = False,
+                          log: bool = False, tagger: str = None, now=None):
+        """Return event_parser.parse_event(raw, debug, log, tagger, now),
+        parsed on the executor. tagger defaults to the parser's.
+
+        now is resolved here, when the call is made, so a clock
+        function never has to be sent to a worker process.
+        """
+        now = event_parser.reference_time(now)
+        return await self.run(event_parser.parse_event, raw, debug, log,
+                              tagger or self.tagger, now)
+
+    async def parse_events(self, phrases, debug: bool = False,
+                           log: bool = False, tagger: str = None, now=None,
+                           chunksize: int = 64) -> list:
+        """Return event_parser.parse_events(phrases, debug, log, tagger,
+        now), parsed on the executor in batches of chunksize phrases.
+
+        The batches run concurrently, up to max_concurrency at once.
+        If the call is cancelled, batches not yet started are
+        withdrawn.
+        """
+        now = event_parser.reference_time(now)
+        phrases = list(phrases)
+        batches = [self.run(event_parser.parse_events,
+                            phrases[i:i + chunksize], debug, log,
+                            tagger or self.tagger, now)
+                   for i in range(0, len(phrases), chunksize)]
+        results = []
+        for res in await asyncio.gather(*batches):
+            results.extend(res)
+        return results
+
+
+# the parser used by parse_event_async() and parse_events_async(): the
+# loop's default thread pool, with no cap
+default_parser = AsyncParser()
+
+
+async def parse_event_async(raw: str, debug: bool = False, log: bool = False,
+                            tagger: str = None, now=None,
+                            parser: AsyncParser = None):
+    """Parse a phrase without blocking the event loop.
+
+    Returns the parse_event() result. parser is the AsyncParser to use
+    (default: default_parser); tagger, if given, overrides its tagger
+    engine.
+    """
+    parser = parser or default_parser
+    return await parser.parse_event(raw, debug, log, tagger, now)
+
+
+async def parse_events_async(phrases, debug: bool = False, log: bool = False,
+                             tagger: str = None, now=None,
+                             parser: AsyncParser = None,
+                             chunksize: int = 64) -> list:
+    """Parse many phrases without blocking the event loop.
+
+    Returns the parse_events() result list. parser and tagger are as
+    for parse_event_async(), and chunksize as for
+    AsyncParser.parse_events().
+    """
+    parser = parser or default_parser
+    return await parser.parse_events(phrases, debug, log, tagger, now,
+                                     chunksize)
@@ -0,0 +1,281 @@
+# event_incremental.py: Re-parse a phrase incrementally as it is edited
+#
+# Copyright (C) 2018 Cardinal Peak LLC
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# How the rule passes are resumed
+#
+# Each pass steps through its token list by position, and the rules at
+# position s read (and write) only tokens from s on: usually no more
+# than rule_window of them, but a location phrase runs as long as it
+# runs. Call position r a cut if no position before r read any token
+# from r on. At a cut, the tokens from r on are untouched by the pass
+# so far, and what the pass did before r depends only on the tokens
+# before r.
+#
+# So after an edit, each pass keeps its results up to the last cut at
+# or before the first changed token, and steps through from there on
+# fresh tokens. Once it is past the changed tokens, at a position that
+# is a cut both in this run and in the last one (shifted by the change
+# in length), the rest of the pass would go exactly as last time, and
+# its results from there are kept too.
+
+import event_parser
+from etoken import ETokenNull
+from parse_cache import clock_relative_re
+import taggers
+
+# what the rule passes read past the end of a token list, as for
+# etoken.padded()
+padding = ETokenNull()
+
+
+class TokenView():
+    """A token list, as the rule passes see it, that makes each token
+    with make(i) when it is first read, and records in .reach the
+    highest index read. Indexes from n up read as padding, and len()
+    includes rule_window tokens of it, so the passes never pad the
+    list themselves.
+    """
+
+    def __init__(self, make, n: int, start: int):
+        self.make = make
+        self.n = n
+        self.tokens = {}
+        self.reach = start - 1
+
+    def __len__(self) -> int:
+        return self.n + event_parser.rule_window
+
+    def __getitem__(self, i: int):
+        if i > self.reach:
+            self.reach = i
+        tok = self.tokens.get(i)
+        if tok is None:
+            tok = self.make(i) if i < self.n else padding
+            self.tokens[i] = tok
+        return tok
+
+
+def last_cut(cuts: list, a: int) -> int:
+    """Return the last cut at or before position a"""
+    r = min(a, len(cuts) - 1)
+    while not cuts[r]:
+        r -= 1
+    return r
+
+
+def run_pass(step, view: TokenView, start: int, same_from: int,
+             old_cuts: list, shift: int) -> tuple:
+    """Call step(view, s) at s = start, start + 1, ... and return
+    (results, cuts, stop).
+
+    results holds what step returned at each position, and cuts whether
+    each position, and then the end of the list, was a cut. Stepping
+    stops at the end of the list (stop is then None), or at the first
+    position stop from same_from on that is a cut both in this run and,
+    at stop - shift, in old_cuts, the cuts of the last run.
+    """
+    results = []
+    cuts = []
+    s = start
+    while True:
+        cut = view.reach < s
+        if cut and s >= same_from and old_cuts[s - shift]:
+            return (results, cuts, s)
+        cuts.append(cut)
+        if s == view.n:
+            return (results, cuts, None)
+        results.append(step(view, s))
+        s += 1
+
+
+class IncrementalParser():
+    """Parses successive versions of a phrase, as it is typed or edited,
+    reusing as much as it can of the work done on the last version.
+
+    parse(raw) returns exactly what event_parser.parse_event(raw) would,
+    for the same tagger engine and reference time. The phrase is
+    tokenized again in full each time, as NLTK's tokenizer looks at the
+    whole phrase, but only the words around the edit are tagged again,
+    and the rule passes are only run again around the edit (see the
+    comment at the top of this file). So for an edit of a few words,
+    the time those take does not grow with the length of the phrase.
+    The cost of assembling the result, which is small, still does.
+
+    The phrase pass is run again in full when the reference time has
+    changed and the phrase mentions minutes or hours ("in 2 hours"),
+    and both passes when the reference date has changed.
+
+    .work holds, for the last call, the number of words tagged and of
+    positions stepped through by each rule pass. An IncrementalParser
+    is not safe to share between threads; use one per editor.
+    """
+
+    def __init__(self, tagger: str = None):
+        self.tagger = tagger
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget the last phrase, so the next is parsed from scratch."""
+        self.raw = None
+        self.now = None
+        self.engine = None
+        self.words = []
+        self.tags = []
+        # the collapse / expand pass: the tokens output at each input
+        # position, and the cuts of the pass
+        self.collapse_out = []
+        self.collapse_cuts = [True]
+        self.reset_phrase_pass()
+        self.result = None
+        self.work = {"tag": 0, "collapse": 0, "phrase": 0}
+
+    def reset_phrase_pass(self) -> None:
+        # the phrase pass: its input (the collapse / expand pass output),
+        # each token's state after the pass, and the cuts of the pass
+        self.phrase_in = []
+        self.phrase_out = []
+        self.phrase_cuts = [True]
+
+    def parse(self, raw: str, now=None) -> tuple:
+        """Parse raw to a calendar event, returning the same tuple as
+        event_parser.parse_event(raw, tagger=..., now=now)."""
+        now = event_parser.reference_time(now)
+        engine = self.tagger or event_parser.tagger_engine
+        if raw == self.raw and now == self.now and engine == self.engine:
+            return self.result
+        if ((self.now is not None and now.date() != self.now.date()) or
+                engine != self.engine):
+            self.reset()
+        elif now != self.now and clock_relative_re.search(raw):
+            self.reset_phrase_pass()
+        today = now.date()
+
+        words = event_parser.word_tokenize(raw)
+        (tags, same_to, same_from, tag_work) = self.retag(words)
+        shift = len(words) - len(self.words)
+        tagged = list(zip(words, tags))
+
+        # First pass: collapse / expand
+        start = last_cut(self.collapse_cuts, same_to)
+        view = TokenView(lambda i: event_parser.make_token(tagged[i]),
+                         len(tagged), start)
+        (out, cuts, stop) = run_pass(
+            lambda t, s: event_parser.collapse_expand_tokens(t, s, today),
+            view, start, same_from, self.collapse_cuts, shift)
+        collapse_work = len(out)
+        kept = [] if stop is None else self.collapse_out[stop - shift:]
+        collapse_out = self.collapse_out[:start] + out + kept
+        collapse_cuts = (self.collapse_cuts[:start] + cuts +
+                         ([] if stop is None else
+                          self.collapse_cuts[stop - shift:]))
+
+        # The phrase pass input changed only where the collapse pass
+        # was run again
+        phrase_in = [tok for toks in collapse_out for tok in toks]
+        if self.phrase_in:
+            same_to = sum(map(len, collapse_out[:start]))
+            same_from = len(phrase_in) - sum(map(len, kept))
+            if stop is None:
+                same_from = len(phrase_in)
+        else:
+            (same_to, same_from) = (0, len(phrase_in))
+        shift = len(phrase_in) - len(self.phrase_in)
+
+        # Second pass: parse for phrases, on copies of the input tokens
+        start = last_cut(self.phrase_cuts, same_to)
+        view = TokenView(lambda i: phrase_in[i].copy(), len(phrase_in),
+                         start)
+
+        def step(t, s):
+            event_parser.parse_phrase(t, s, now)
+            # no later position changes this token
+            return t.tokens[s]
+
+        (out, cuts, stop) = run_pass(step, view, start, same_from,
+                                     self.phrase_cuts, shift)
+        phrase_out = (self.phrase_out[:start] + out +
+                      ([] if stop is None else self.phrase_out[stop - shift:]))
+        phrase_cuts = (self.phrase_cuts[:start] + cuts +
+                       ([] if stop is None else
+                        self.phrase_cuts[stop - shift:]))
+
+        # sem_dict() marks the title tokens; doing so again to the
+        # tokens kept from the last run changes nothing
+        d = event_parser.sem_dict(phrase_out)
+        (title, location) = event_parser.title_and_location(d)
+        (st_date, end_date, st_time, end_time) = \
+            event_parser.compute_dates_and_times(d, today)
+
+        # nothing is kept until the parse has succeeded
+        (self.raw, self.now, self.engine) = (raw, now, engine)
+        (self.words, self.tags) = (words, tags)
+        (self.collapse_out, self.collapse_cuts) = (collapse_out, collapse_cuts)
+        (self.phrase_in, self.phrase_out, self.phrase_cuts) = \
+            (phrase_in, phrase_out, phrase_cuts)
+        self.work = {"tag": tag_work, "collapse": collapse_work,
+                     "phrase": len(out)}
+        self.result = (st_date, end_date, st_time, end_time, title, location)
+        return self.result
+
+    def retag(self, words: list) -> tuple:
+        """Tag words, reusing the tags of the last phrase's words where
+        the words around them are unchanged.
+
+        Returns (tags, same_to, same_from, work): the words and tags
+        before same_to, and from same_from on, are the same as last
+        time (at indexes shifted by the change in length, from
+        same_from on), and work is the number of words tagged.
+        """
+        (old_words, old_tags) = (self.words, self.tags)
+        n = len(words)
+        shift = n - len(old_words)
+        k = taggers.context_words
+
+        # the words before prefix are unchanged, and so are the words
+        # from n - suffix on
+        limit = min(n, len(old_words))
+        prefix = 0
+        while prefix < limit and words[prefix] == old_words[prefix]:
+            prefix += 1
+        suffix = 0
+        while (suffix < limit - prefix and
+               words[n - suffix - 1] == old_words[n - suffix - 1 - shift]):
+            suffix += 1
+
+        # The tags before start are unchanged. From there on, tag until
+        # a word's context words, and the tags of those before it, are
+        # as they were last time: then so are the rest of the tags.
+        start = max(prefix - k, 0)
+        tags = old_tags[:start]
+        same_from = n
+        tagger = event_parser.pos_tagger(self.tagger)
+        for (i, tag) in enumerate(taggers.iter_tags(tagger, words, start,
+                                                    tags), start):
+            j = i + 1
+            tags.append(tag)
+            if (j - k >= n - suffix and j < n and
+                    tags[j - k:j] == old_tags[j - k - shift:j - shift]):
+                tags.extend(old_tags[j - shift:])
+                same_from = j
+                break
+
+        same_to = start
+        while (same_to < limit and words[same_to] == old_words[same_to] and
+               tags[same_to] == old_tags[same_to]):
+            same_to += 1
+        return (tags, min(same_to, same_from), same_from,
+                len(tags) - start - (n - same_from))
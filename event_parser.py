@@ -17,14 +17,21 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-import nltk
 import re
 from datetime import time, date, timedelta, datetime
-from dateutil import relativedelta
+from functools import lru_cache
+from time import perf_counter
 from etoken import EToken, padded
+from norm_values import TimeValue, DateValue, ABS, REL, WEEKDAY, MONTHDAY
 from spelled_numbers import handle_spelled_number
+import taggers
 
+# parse_event(log=True) passes each phrase to the log(line) method of
+# query_logger. If that is None, the phrases go to a
+# query_log.QueryLogger on the file logfile, which buffers them and
+# writes them from a background thread.
 logfile = "/Users/howdy/Code/Event NLP/queries.log"
+query_logger = None
 
 meridian_txt = ["a", "am", "a.m.", "a.m", "p", "pm", "p.m.", "p.m"]
 day_txt = ["day", "days", "d"]
@@ -48,13 +55,46 @@ month_to_num = {"january": 1, "jan": 1, "february": 2, "feb": 2,
                 "october": 10, "oct": 10, "november": 11, "nov": 11,
                 "december": 12, "dec": 12}
 
-today = date.today()
-tomorrow = today + timedelta(days=1)
-yesterday = today - timedelta(days=1)
+# The part-of-speech tagger engine used when parse_event() is not told
+# otherwise: "nltk" or "lite" (see taggers.py)
+tagger_engine = "nltk"
+
+# The clock giving the reference time for parse_event() calls that are
+# not given one. Phrases such as "tomorrow" or "in 2 hours" are
+# relative to the reference time. Any function returning a datetime
+# will do.
+clock = datetime.now
+
+# the words for days relative to the reference date, and their offsets
+day_offsets = {"today": 0, "tomorrow": 1, "yesterday": -1}
+
+# (reference date, table) for the most recent day_table() call. Kept
+# as one tuple, so that it is read and replaced in one step; see
+# day_table().
+day_table_state = (None, None)
 
 # if 4-digit years are specified, they must fall in this range
 year_range = [1901, 2099]
 
+# The most results each memoized value parser keeps (see memo_stats()).
+# Read once, at import time. The memos assume the settings above are
+# not changed after import; call clear_memos() if they are.
+memo_size = 4096
+
+# collapse_expand_tokens() and parse_phrase() look at no more than this
+# many tokens, starting at the current position
+rule_window = 10
+
+# whether the rules of both passes count their attempts, fires and
+# time; see enable_rule_stats()
+rule_stats_enabled = False
+
+# Every pattern the parser uses is compiled exactly once, at import
+# time, below. Nothing on the parse path compiles a pattern, or hands
+# a pattern string to re.search(), re.sub() and the like, which would
+# compile (and cache) it there; event_parser_test.py checks that the
+# re module's cache stays empty while the corpus is parsed.
+
 # regexps to parse for time
 ampm = r"((?:[ap]m?)|(?:[ap]\.?m\.?))"    # a, am, a.m.
 timespec = r"(\d{1,2}):(\d{2})(:\d{2})?" + ampm + "?"  # hh:mm[:ss][am]
@@ -82,7 +122,134 @@ re_time_possible = ("(" + timespec + ")|"
                     "(" + mid_noon + ")")
 
 
-def parse_time_to_norm(s: str) -> str:
+# Single-pass grammar for parse_time_value(). Each alternative is
+# wrapped in a named group so that m.lastgroup says which form
+# matched; the alternatives are tried in the same order as the
+# individual patterns above.
+ampm_nc = r"(?:[ap]m?|[ap]\.?m\.?)"
+time_grammar = re.compile(
+    r"(?P<norm>(?P<norm_kind>rel|abs)time:(?P<norm_h>\d{2}):(?P<norm_m>\d{2}):"
+    r"(?P<norm_s>\d{2}))"
+    r"|(?P<midnight>midnight)"
+    r"|(?P<noon>noon)"
+    r"|(?P<timespec>(?P<ts_h>\d{1,2}):(?P<ts_m>\d{2})(?::(?P<ts_s>\d{2}))?"
+    r"(?P<ts_ap>" + ampm_nc + r")?)"
+    r"|(?P<hourspec>(?P<hr_h>\d{1,2})(?P<hr_ap>" + ampm_nc + r")?)"
+    r"|(?P<milspec>(?P<mil_h>\d{2})(?P<mil_m>\d{2}))"
+    r"|(?P<nocolon>(?P<nc_h>\d{1,2})(?P<nc_m>\d{2})(?P<nc_ap>" + ampm_nc +
+    r")?)"
+    r"|(?P<oclspec>(?P<ocl_h>\d{1,2})o'?clock)")
+
+# Single-pass grammar for the numeric and normal forms in parse_date_value()
+date_grammar = re.compile(
+    r"(?P<absnorm>absdate:(?P<an_m>\d{2})/(?P<an_d>\d{2})/(?P<an_y>\d{4}))"
+    r"|(?P<relnorm>reldate:(?P<rn_m>\d{2})/(?P<rn_d>\d{2}))"
+    r"|(?P<weekdaynorm>reldate:weekday:(?P<wn>\d))"
+    r"|(?P<monthdaynorm>reldate:monthday:(?P<mn>\d{1,2}))"
+    r"|(?P<ymd>(?P<ymd_y>\d{4})(?P<ymd_sep>[-/])(?P<ymd_m>\d{1,2})"
+    r"(?P=ymd_sep)(?P<ymd_d>\d{1,2}))"
+    r"|(?P<mdy>(?P<mdy_m>\d{1,2})(?P<mdy_sep>[-/])(?P<mdy_d>\d{1,2})"
+    r"(?:(?P=mdy_sep)(?P<mdy_y>\d{4}|\d{2}))?)")
+
+# patterns for parse_time_date_range()
+time_certain_re = re.compile(re_time_certain)
+time_possible_re = re.compile(re_time_possible)
+time_range_certain_first_re = re.compile(
+    f"(?P<first>{re_time_certain})-(?P<second>{re_time_possible})")
+time_range_certain_second_re = re.compile(
+    f"(?P<first>{re_time_possible})-(?P<second>{re_time_certain})")
+time_range_mil_re = re.compile(
+    f"(?P<first>{milspec})-(?P<second>{milspec})")
+time_range_possible_re = re.compile(
+    f"(?P<first>{re_time_possible})-(?P<second>{re_time_possible})")
+
+datespec = r"\d{1,2}/\d{1,2}(?:/(?:\d{2}|\d{4}))?"  # mm/dd/yy, mm/dd/yyyy
+datespec_yfirst = r"\d{4}/\d{1,2}/\d{1,2}"          # yyyy/mm/dd
+date_range_re = re.compile(f"^({datespec})-({datespec})$")
+date_range_yfirst_re = re.compile(
+    f"^({datespec_yfirst})-({datespec_yfirst})$")
+date_single_re = re.compile(f"^({datespec})|({datespec_yfirst})$")
+date_hyphen_re = re.compile(r"^(\d{1,2}|\d{4})-(\d{1,2})-(\d{2}|\d{4})$")
+
+year_re = re.compile(r"\d{4}")
+
+# patterns for clean_punctuation()
+punct_space_re = re.compile(" ([,.!'])")
+open_quote_re = re.compile(" `` ")
+close_quote_re = re.compile("''")
+leading_punct_re = re.compile("^[,.] ")
+trailing_punct_re = re.compile("[,.!]$")
+
+
+# NLTK and dateutil are imported when first needed, not when this
+# module is imported; call warmup() to load everything ahead of time.
+def word_tokenize(raw: str) -> list:
+    """Split raw into words, with nltk.word_tokenize()"""
+    import nltk
+    return nltk.word_tokenize(raw)
+
+
+def add_months(d: date, months: int) -> date:
+    """Return the date d plus the given number of months"""
+    from dateutil.relativedelta import relativedelta
+    return d + relativedelta(months=months)
+
+
+def reference_time(now=None) -> datetime:
+    """Return the reference time for a parse, as a datetime.
+
+    now may be a datetime, a date (taken as midnight at the start of
+    that day), a function returning either (such as datetime.now),
+    or None for the module's clock.
+    """
+    if now is None:
+        now = clock
+    if callable(now):
+        now = now()
+    if not isinstance(now, datetime):
+        now = datetime.combine(now, time())
+    return now
+
+
+def day_table(today: date) -> dict:
+    """Return a dict mapping "today", "tomorrow" and "yesterday" to
+    their DateValues, for the reference date today.
+
+    The table for the most recent reference date is kept, so it is
+    only rebuilt when the date changes, as when a long-running process
+    passes midnight. Threads parsing relative to different dates may
+    rebuild it in turn, but each gets the table for its own date.
+    """
+    global day_table_state
+    (table_date, table) = day_table_state
+    if table_date != today:
+        table = {word: DateValue.from_date(today + timedelta(days=offset))
+                 for (word, offset) in day_offsets.items()}
+        day_table_state = (today, table)
+    return table
+
+
+def __getattr__(name: str):
+    """Provide today, tomorrow and yesterday as module attributes, as
+    datetime.dates relative to the current reference time."""
+    if name in day_offsets:
+        return reference_time().date() + timedelta(days=day_offsets[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def pos_tagger(engine: str = None):
+    """Return the part-of-speech tagger for the named engine (default:
+    tagger_engine), loading it on first use.
+
+    The "nltk" engine tags exactly as nltk.pos_tag() does, but is only
+    loaded once per process, whereas nltk.pos_tag() loads the model
+    again on every call.
+    """
+    return taggers.get_tagger(engine or tagger_engine)
+
+
+@lru_cache(maxsize=memo_size)
+def parse_time_value(s: str) -> TimeValue:
     """Attempt to parse a string into a time.
 
     If the input string is a time in one of the forms:
@@ -94,91 +261,68 @@ def parse_time_to_norm(s: str) -> str:
         reltime:hour:minute:second
         midnight | noon
 
-    return a string of one of the forms
-
-       "abstime:hour:minute:second", with hour in the range 0-23, if
-          we can determine for certain the am/pm
-
-       "reltime:hour:minute:second", with hour in the range 1-12, if we
-         cannot determine the am/pm
+    return a TimeValue, which is absolute (hour in the range 0-23) if
+    we can determine for certain the am/pm, or relative (hour in the
+    range 1-12) if we cannot.
 
     otherwise return None
+
+    Results are memoized, so the same TimeValue is returned for the
+    same string.
     """
 
-    # special cases
-    if s == "midnight":
-        return "abstime:00:00:00"
-    if s == "noon":
-        return "abstime:12:00:00"
+    # special case
     if s == "000":
         return None
-    if re.match(r"^(rel)|(abs)time:\d{2}:\d{2}:\d{2}$", s):
-        return s
 
-    hour = None
-    minutes = None
-    seconds = 0
+    m = time_grammar.fullmatch(s)
+    if not m:
+        return None
 
-    is_pm = False
-    meridian_specified = False
+    form = m.lastgroup
+    if form == "norm":
+        return TimeValue(m.group("norm_kind") == "abs", int(m.group("norm_h")),
+                         int(m.group("norm_m")), int(m.group("norm_s")))
+    if form == "midnight":
+        return TimeValue(True, 0)
+    if form == "noon":
+        return TimeValue(True, 12)
 
-    m = re.fullmatch(timespec, s)
-    if m:
-        hour = int(m.group(1))
-        minutes = int(m.group(2))
-        if (m.group(3)):
-            seconds = int(m.group(3)[1:])
-        if m.group(4):
-            meridian_specified = True
-            if m.group(4)[0] == "p":
-                is_pm = True
-        else:  # special case of hour being specified as 0 or 00
-            if m.group(1) in ["0", "00"]:
-                meridian_specified = True
-                is_pm = False
-
-    if hour is None:
-        m = re.fullmatch(hourspec, s)
-        if m and 1 <= int(m.group(1)) <= 23:
-            hour = int(m.group(1))
-            minutes = 0
-            if m.group(2):
-                if (hour > 12):
-                    hour = None
-                else:
-                    meridian_specified = True
-                    if m.group(2)[0] == "p":
-                        is_pm = True
-
-    if hour is None:
-        m = re.fullmatch(milspec, s)
-        if m:
-            hour = int(m.group(1))
-            minutes = int(m.group(2))
-            meridian_specified = True
-
-    if hour is None:
-        m = re.fullmatch(nocolon, s)
-        if m:
-            hour = int(m.group(1))
-            minutes = int(m.group(2))
-            if m.group(3):
-                if (hour > 12):
-                    hour = None
-                else:
-                    meridian_specified = True
-                    if m.group(3)[0] == "p":
-                        is_pm = True
-
-    if hour is None:
-        m = re.fullmatch(oclspec, s)
-        if m and 1 <= int(m.group(1)) <= 12:
-            hour = int(m.group(1))
-            minutes = 0
-            meridian_specified = False
-
-    if hour is None:
-        return None
+    seconds = 0
+    meridian = None
+
+    if form == "timespec":
+        hour = int(m.group("ts_h"))
+        minutes = int(m.group("ts_m"))
+        if m.group("ts_s"):
+            seconds = int(m.group("ts_s"))
+        meridian = m.group("ts_ap")
+        # special case of hour being specified as 0 or 00
+        if meridian is None and m.group("ts_h") in ["0", "00"]:
+            meridian = "a"
+    elif form == "hourspec":
+        hour = int(m.group("hr_h"))
+        minutes = 0
+        meridian = m.group("hr_ap")
+        if not 1 <= hour <= 23:
+            return None
+        if meridian and hour > 12:
+            return None
+    elif form == "milspec":
+        hour = int(m.group("mil_h"))
+        minutes = int(m.group("mil_m"))
+        meridian = "a"    # military time is always absolute
+    elif form == "nocolon":
+        hour = int(m.group("nc_h"))
+        minutes = int(m.group("nc_m"))
+        meridian = m.group("nc_ap")
+        if meridian and hour > 12:
+            return None
+    else:    # oclspec
+        hour = int(m.group("ocl_h"))
+        minutes = 0
+        if not 1 <= hour <= 12:
+            return None
 
     if (not 0 <= hour <= 23):
         return None
@@ -187,16 +331,29 @@ def parse_time_to_norm(s: str) -> str:
     if (not 0 <= seconds <= 59):
         return None
 
-    if (meridian_specified and is_pm and hour < 12):
+    if (meridian and meridian[0] == "p" and hour < 12):
         hour += 12
 
-    if (meridian_specified or hour > 12):
-        return f"abstime:{hour:02}:{minutes:02}:{seconds:02}"
-    else:
-        return f"reltime:{hour:02}:{minutes:02}:{seconds:02}"
+    return TimeValue(bool(meridian) or hour > 12, hour, minutes, seconds)
+
+
+def parse_time_to_norm(s: str) -> str:
+    """Like parse_time_value(), but return the time as a string of one
+    of the forms
+
+       "abstime:hour:minute:second", with hour in the range 0-23, if
+          we can determine for certain the am/pm
+
+       "reltime:hour:minute:second", with hour in the range 1-12, if we
+         cannot determine the am/pm
+
+    otherwise return None
+    """
+    val = parse_time_value(s)
+    return str(val) if val else None
 
 
-def parse_date_to_norm(s: str) -> str:
+def parse_date_value(s: str, today: date = None) -> DateValue:
     """Attempt to parse a string into a date.
 
     If the input string is a date in one of the forms:
@@ -204,75 +361,143 @@ def parse_date_to_norm(s: str) -> str:
         mm/dd/yyyy or mm-dd-yyyy (where year can be omitted, or 2 or 4 digits)
         a weekday, including common abbreviations
         today | tomorrow | yesterday
-       "absdate:month/day/year", if we know the year for certain
-       "reldate:(stuff)", if we cannot determine the year
+        one of the string normal forms returned by parse_date_to_norm()
 
-    return a string of one of the normalized date forms
-
-       "absdate:month/day/year", if we know the year for certain
-       "reldate:month/day", if we cannot determine the year
-       "reldate:weekday:(num)",  (e.g., "on Thursday")
-       "reldate:monthday:(num)", (e.g., "on the 21st")
+    return a DateValue, which is ABS if we know the year for certain,
+    REL if we cannot determine the year, or WEEKDAY (e.g., "on
+    Thursday").
 
     otherwise return None
+
+    today is the reference date (default: that of the module's clock),
+    which "today" and 2-digit years are relative to. Results are
+    memoized on s and today.
     """
+    if today is None:
+        today = reference_time().date()
+    return date_value(s, today)
+
 
-    if (re.match(r"^reldate:", s) or
-        re.fullmatch(r"absdate:\d{2}/\d{2}/\d{4}", s)):
-        return s
+@lru_cache(maxsize=memo_size)
+def date_value(s: str, today: date) -> DateValue:
+    """parse_date_value(s, today), with today required. This is the
+    memoized part, keyed on s and the reference date."""
 
     # first parse weekdays
     if s in weekday_to_num:
-        num = weekday_to_num[s]
-        return f"reldate:weekday:{num}"
+        return DateValue(WEEKDAY, weekday=weekday_to_num[s])
 
     # today, tomorrow
-    if s == "today":
-        return today.strftime("absdate:%m/%d/%Y")
-    if s == "tomorrow":
-        return tomorrow.strftime("absdate:%m/%d/%Y")
-    if s == "yesterday":
-        return yesterday.strftime("absdate:%m/%d/%Y")
+    if s in day_offsets:
+        return day_table(today)[s]
 
-    year = None
-    month = None
-    day = None
+    m = date_grammar.fullmatch(s)
+    if not m:
+        return None
 
-    # match date: yyyy/mm/dd. must be 4 digit yr and year must be specified
-    m = re.fullmatch(r"(\d{4})(?P<sep>[-/])(\d{1,2})(?P=sep)(\d{1,2})", s)
-    if m:
-        year = int(m.group(1))
-        month = int(m.group(3))
-        day = int(m.group(4))
+    form = m.lastgroup
+    if form == "absnorm":
+        return DateValue(ABS, int(m.group("an_y")), int(m.group("an_m")),
+                         int(m.group("an_d")))
+    if form == "relnorm":
+        return DateValue(REL, month=int(m.group("rn_m")),
+                         day=int(m.group("rn_d")))
+    if form == "weekdaynorm":
+        return DateValue(WEEKDAY, weekday=int(m.group("wn")))
+    if form == "monthdaynorm":
+        return DateValue(MONTHDAY, day=int(m.group("mn")))
 
-    # match date: mm/dd/yyyy or mm/dd/yy, year may be omitted
-    mdyspec = r"(\d{1,2})(?P<sep>[-/])(\d{1,2})((?P=sep)(?:\d{2}|\d{4}))?"
-    m = re.fullmatch(mdyspec, s)
-    if m:
-        month = int(m.group(1))
-        day = int(m.group(3))
-        if m.group(4):
-            year = int(m.group(4)[1:])
+    year = None
+
+    if form == "ymd":
+        # yyyy/mm/dd: must be 4 digit yr and year must be specified
+        year = int(m.group("ymd_y"))
+        month = int(m.group("ymd_m"))
+        day = int(m.group("ymd_d"))
+    else:
+        # mm/dd/yyyy or mm/dd/yy, year may be omitted
+        month = int(m.group("mdy_m"))
+        day = int(m.group("mdy_d"))
+        if m.group("mdy_y"):
+            year = int(m.group("mdy_y"))
             # arbitrarily: 2-digit yrs interpreted as within [-50,+49] of now
             if year < 100:
                 year += 2000
                 if year > today.year + 49:
                     year -= 100
 
-    if (month is None or day is None or not 1 <= month <= 12 or
-        not 1 <= day <= 31):
+    if not 1 <= month <= 12 or not 1 <= day <= 31:
         return None
 
     if year is None:
-        return f"reldate:{month:02}/{day:02}"
+        return DateValue(REL, month=month, day=day)
 
     if min(year_range) <= year <= max(year_range):
-        return f"absdate:{month:02}/{day:02}/{year:04}"
+        return DateValue(ABS, year, month, day)
+
+    return None
+
+
+def parse_date_to_norm(s: str, today: date = None) -> str:
+    """Like parse_date_value(), but return the date as a string of one
+    of the normalized date forms
+
+       "absdate:month/day/year", if we know the year for certain
+       "reldate:month/day", if we cannot determine the year
+       "reldate:weekday:(num)",  (e.g., "on Thursday")
+       "reldate:monthday:(num)", (e.g., "on the 21st")
+
+    otherwise return None
+    """
+    val = parse_date_value(s, today)
+    return str(val) if val else None
 
+
+def parse_monthday_value(s: str) -> DateValue:
+    """Parse a bare day of the month, as in "the 21st" (whose token
+    value is "21"), to a MONTHDAY DateValue. Return None if s is not
+    a day of the month.
+    """
+    if s.isdigit() and 1 <= int(s) <= 31:
+        return DateValue(MONTHDAY, day=int(s))
     return None
 
 
-def parse_time_date_range(tok: EToken, lookahead: EToken) -> list:
+def time_token(orig: str, val: TimeValue, sem: str = "TIME") -> EToken:
+    """Return a new TIME token carrying the time val"""
+    tok = EToken(orig, "TIME", sem)
+    tok.time = val
+    return tok
+
+
+def date_token(orig: str, val: DateValue, sem: str = "DATE") -> EToken:
+    """Return a new DATE token carrying the date val"""
+    tok = EToken(orig, "DATE", sem)
+    tok.date = val
+    return tok
+
+
+def token_time(t: EToken) -> TimeValue:
+    """Return the time carried by token t, or if it is not (yet) a time
+    token, try to parse its value as a time.
+    """
+    if t.time is not None:
+        return t.time
+    return parse_time_value(t.val)
+
+
+def token_date(t: EToken, today: date = None) -> DateValue:
+    """Return the date carried by token t, or if it is not (yet) a date
+    token, try to parse its value as a date, relative to the reference
+    date today.
+    """
+    if t.date is not None:
+        return t.date
+    return parse_date_value(t.val, today)
+
+
+def parse_time_date_range(tok: EToken, lookahead: EToken,
+                          today: date = None) -> list:
     """First attempt to parse a token to a time or date.
 
     Handles the following cases:
@@ -293,6 +518,9 @@ def parse_time_date_range(tok: EToken, lookahead: EToken) -> list:
       token, which could be a meridian ("am", "AM", "a.m.", etc) or
       the word "o'clock"
 
+    Dates are relative to the reference date today (default: that of
+    the module's clock).
+
     If no match, return None.
     """
 
@@ -301,11 +529,9 @@ def parse_time_date_range(tok: EToken, lookahead: EToken) -> list:
 
     # time ranges
 
-    m = re.fullmatch(f"(?P<first>{re_time_certain})-(?P<second>{re_time_possible})",
-                     tok.val)
+    m = time_range_certain_first_re.fullmatch(tok.val)
     if not m:
-        m = re.fullmatch(f"(?P<first>{re_time_possible})-(?P<second>{re_time_certain})",
-                         tok.val)
+        m = time_range_certain_second_re.fullmatch(tok.val)
 
     # handle case where we've matched a time, but the lookahead is a meridian
     if m and lookahead.match(meridian_txt):
@@ -313,96 +539,93 @@ def parse_time_date_range(tok: EToken, lookahead: EToken) -> list:
         ignore_lookahead = True
 
     if not m:
-        m = re.fullmatch(f"(?P<first>{milspec})-(?P<second>{milspec})",
-                         tok.val)
+        m = time_range_mil_re.fullmatch(tok.val)
 
     if not m and lookahead.match(meridian_txt):
-        m = re.fullmatch(f"(?P<first>{re_time_possible})-(?P<second>{re_time_possible})",
-                         tok.val)
+        m = time_range_possible_re.fullmatch(tok.val)
         append_second = lookahead.val
         ignore_lookahead = True
 
     if m:
-        st = parse_time_to_norm(m.group("first"))
-        end = parse_time_to_norm(m.group("second") + append_second)
+        st = parse_time_value(m.group("first"))
+        end = parse_time_value(m.group("second") + append_second)
         if st is not None and end is not None:
             if ignore_lookahead:
                 lookahead.sem = "IGN"
-            return [EToken(st, "TIME", "ST_TIME"),
+            return [time_token(tok.orig, st, "ST_TIME"),
                     EToken("UNTIL", ":", "IGN"),
-                    EToken(end, "TIME", "ST_TIME")]
+                    time_token(tok.orig, end, "ST_TIME")]
 
     # parse standalone time
     if lookahead.match(meridian_txt + ["o'clock", "oclock"]):
-        m = re.fullmatch(re_time_possible, tok.val)
+        m = time_possible_re.fullmatch(tok.val)
         if m:
-            val = parse_time_to_norm(tok.val + lookahead.val)
+            val = parse_time_value(tok.val + lookahead.val)
             if val:
                 lookahead.sem = "IGN"
-                return [EToken(val, "TIME", "TIME")]
+                return [time_token(tok.orig, val)]
 
-    m = re.fullmatch(re_time_certain, tok.val)
+    m = time_certain_re.fullmatch(tok.val)
     if m:
-        val = parse_time_to_norm(tok.val)
+        val = parse_time_value(tok.val)
         if val:
-            return [EToken(val, "TIME", "TIME")]
+            return [time_token(tok.orig, val)]
 
     # date range
-    datespec = r"\d{1,2}/\d{1,2}(?:/(?:\d{2}|\d{4}))?"  # mm/dd/yy, mm/dd/yyyy
-    datespec_yfirst = r"\d{4}/\d{1,2}/\d{1,2}"          # yyyy/mm/dd
-    m = re.match(f"^({datespec})-({datespec})$", tok.val)
+    m = date_range_re.match(tok.val)
     if m:
-        st = parse_date_to_norm(m.group(1))
-        end = parse_date_to_norm(m.group(2))
+        st = parse_date_value(m.group(1), today)
+        end = parse_date_value(m.group(2), today)
         if st is not None and end is not None:
-            return [EToken(st, "DATE", "ST_DATE"),
+            return [date_token(tok.orig, st, "ST_DATE"),
                     EToken("UNTIL", ":", "IGN"),
-                    EToken(end, "DATE", "END_DATE")]
+                    date_token(tok.orig, end, "END_DATE")]
 
-    m = re.match(f"^({datespec_yfirst})-({datespec_yfirst})$", tok.val)
+    m = date_range_yfirst_re.match(tok.val)
     if m:
-        st = parse_date_to_norm(m.group(1))
-        end = parse_date_to_norm(m.group(2))
+        st = parse_date_value(m.group(1), today)
+        end = parse_date_value(m.group(2), today)
         if st is not None and end is not None:
-            return [EToken(st, "DATE", "ST_DATE"),
+            return [date_token(tok.orig, st, "ST_DATE"),
                     EToken("UNTIL", ":", "IGN"),
-                    EToken(end, "DATE", "END_DATE")]
+                    date_token(tok.orig, end, "END_DATE")]
 
-    m = re.match(f"^({datespec})|({datespec_yfirst})$", tok.val)
+    m = date_single_re.match(tok.val)
     if m:
-        val = parse_date_to_norm(tok.val)
+        val = parse_date_value(tok.val, today)
         if val:
-            return [EToken(val, "DATE", "DATE")]
+            return [date_token(tok.orig, val)]
 
     # we have to be conservative with dates specified using hyphens,
     # because they could mean a lot of different things. For now, it's
     # only a date if it is dd-mm-yyyy or dd-mm-yy, or yyyy-dd-mm
-    m = re.match(r"^(\d{1,2}|\d{4})-(\d{1,2})-(\d{2}|\d{4})$", tok.val)
+    m = date_hyphen_re.match(tok.val)
     if m:
-        val = parse_date_to_norm(tok.val)
+        val = parse_date_value(tok.val, today)
         if val:
-            return [EToken(val, "DATE", "DATE")]
+            return [date_token(tok.orig, val)]
 
     # handle spelled weekdays and special strings
     if (tok.match(weekday_to_num) or
         tok.match(["today", "tomorrow", "yesterday"])):
-        val = parse_date_to_norm(tok.val)
+        val = parse_date_value(tok.val, today)
         if val:
-            return [EToken(val, "DATE", "DATE")]
+            return [date_token(tok.orig, val)]
 
     return None
 
 
-def parse_spelled_date(t_mon: EToken, t_day: EToken, t_year: EToken) -> str:
-    """If possible, parse the three tokens into a date normal form.
+def parse_spelled_date(t_mon: EToken, t_day: EToken,
+                       t_year: EToken) -> DateValue:
+    """If possible, parse the three tokens into a DateValue.
 
     We have a possible date, with 2 or 3 tokens:
        t_mon - a spelled out month
        t_day - a day, either CD or OD form
        t_year - either None, or a possible year in CD form
 
-    If possible, parse this into a date normal form (see above for
-    what this means), and return it.
+    If possible, parse this into a DateValue (ABS if the year is
+    given, otherwise REL), and return it.
 
     Otherwise return None.
     """
@@ -412,133 +635,164 @@ def parse_spelled_date(t_mon: EToken, t_day: EToken, t_year: EToken) -> str:
         return None
 
     if not t_year:
-        return f"reldate:{month:02}/{day:02}"
+        return DateValue(REL, month=month, day=day)
 
-    m = re.fullmatch(r"\d{4}", t_year.val)
+    m = year_re.fullmatch(t_year.val)
     if m and min(year_range) <= int(m.group(0)) <= max(year_range):
-        year = int(m.group(0))
-        return f"absdate:{month:02}/{day:02}/{year:04}"
+        return DateValue(ABS, int(m.group(0)), month, day)
 
     return None
 
 
-def collapse_expand_tokens(token_list: list) -> list:
-    """Collapse and expand the token list as the first phase of processing.
+# Start classes for token values, used with the words themselves in
+# Rule.starts: values beginning with a digit, and values beginning with
+# "noon" or "midnight" (including, say, "noon-2pm").
+digit_start = "<digit>"
+noon_start = "<noon>"
 
-    On input, look at the string of tokens at the head of token_list.
-    Return a list containing 0-N output tokens.
 
-    Makes the following substitutions:
+class Rule():
+    """A named rule of one of the two rule passes, and its counters.
 
-     1) Concatenates a possessive token with the preceeding noun, so
-        for instance the token stream "Doug/NNP" and "'s/POS" will be
-        turned into the single token "Doug's/NNP"
+    .func is called as func(t, s, today) in the collapse / expand pass,
+    or as func(t, s, now) in the phrase pass, and returns None unless
+    the rule fires. The counters (.attempts, .fires and .seconds) are
+    only kept while rule stats are enabled; see enable_rule_stats().
 
-     5) For a string of tokens following the form
-           (time) in the ("morning" | "afternoon" | "evening")
-           (time) at night
-        returns a single token representing the time.
+    .starts lists the leading tokens t[s] the rule can fire on, as
+    (vals, poss) pairs: the rule is only tried if, for some pair, the
+    token's value (or its start class, digit_start or noon_start) is in
+    vals and its part of speech is in poss, where None allows any.
+    .starts of None means the rule is tried on every token. See
+    start_key().
+    """
 
-     6) For the string of tokens
-           next (weekday)
-        returns a single token representing the date.
+    __slots__ = ("name", "func", "starts", "attempts", "fires", "seconds")
+
+    def __init__(self, name: str, func, starts: list = None):
+        self.name = name
+        self.func = func
+        self.starts = starts
+        self.reset()
+
+    def can_start(self, key: tuple) -> bool:
+        """Return True if the rule can fire on a token whose start_key()
+        is key"""
+        if self.starts is None:
+            return True
+        (val, pos) = key
+        return any((vals is None or val in vals) and
+                   (poss is None or pos in poss)
+                   for (vals, poss) in self.starts)
+
+    def reset(self) -> None:
+        """Zero the counters"""
+        self.attempts = 0
+        self.fires = 0
+        self.seconds = 0.0
+
+    def counted(self, t: list, s: int, arg):
+        """Call .func(t, s, arg), counting the attempt, and the fire if
+        it fires, and timing it"""
+        start = perf_counter()
+        res = self.func(t, s, arg)
+        self.seconds += perf_counter() - start
+        self.attempts += 1
+        if res is not None:
+            self.fires += 1
+        return res
 
-     2) For a single token which appears to be of the form
-        (time)-(time) or (date)-(date), return three tokens: (start)
-        (UNTIL) (end), with "start" and "end" simplified for future
-        processing. (*)
+    def __repr__(self):
+        return f"Rule({self.name})"
 
-     3) For two tokens which appear to be of the form (time) (am/pm),
-        returns a single token representing the time. (*)
 
-     4) For a single token which can be unambiguously parsed as either
-        a time or date, returns a single token representing the
-        time/date in processed form (*)
+# The rules of the collapse / expand pass. Each looks at the tokens
+# starting at t[s], where t is padded as for collapse_expand_tokens().
+# A rule that fires returns the list of 0-N tokens to output in place
+# of t[s]; one that does not returns None.
 
-     7) Collapses the following strings of date tokens into a single
-        token representing the date:
-           (day) (spelled-month) (year)
-           (day) (spelled-month)
-           (spelled-month) (day)
-           (spelled-month) (day) (comma) (year)
-
-     8) Collapses the two token string "the" (OD) (as in "the 21st")
-        into a single token representing this as a date.
-
-     (* - these substitutions handled by parse_time_date_range)
+def rule_ignored(t: list, s: int, today: date) -> list:
+    """Drop tokens we've already decided to ignore."""
+    if (t[s].sem == "IGN"):
+        return []
 
-    """
-    t = padded(token_list, 10)
 
-    # ignore stuff we've already decided to ignore
-    if (t[0].sem == "IGN"):
-        return []
+def rule_possessive(t: list, s: int, today: date) -> list:
+    """(NNP) (POS): concatenate possessives"""
+    if t[s].match(pos="NNP") and t[s+1].match(pos="POS"):
+        t[s].orig += t[s+1].orig
+        t[s].val += t[s+1].val
+        t[s+1].sem = "IGN"
+        return [t[s]]
 
-    # concatenate possessives
-    if t[0].match(pos="NNP") and t[1].match(pos="POS"):
-        t[0].orig += t[1].orig
-        t[0].val += t[1].val
-        t[1].sem = "IGN"
-        return [t[0]]
 
-    # (CD) ((in) (the) (morning | afternoon | evening)) | ((at) (night))
-    if t[0].match(pos="CD"):
+def rule_time_of_day(t: list, s: int, today: date) -> list:
+    """(CD) ((in) (the) (morning | afternoon | evening)) | ((at) (night))"""
+    if t[s].match(pos="CD"):
         append = ""
-        if (t[1].match("in", "IN") and t[2].match("the", "DT") and
-            t[3].match(["morning", "afternoon", "evening"])):
-            if t[3].match("morning"):
+        if (t[s+1].match("in", "IN") and t[s+2].match("the", "DT") and
+            t[s+3].match(["morning", "afternoon", "evening"])):
+            if t[s+3].match("morning"):
                 append = "am"
             else:
                 append = "pm"
-            t[1].sem = "IGN"
-            t[2].sem = "IGN"
-            t[3].sem = "IGN"
-        elif (t[1].match("at", "IN") and t[2].match("night")):
+            end_tok = s+3
+        elif (t[s+1].match("at", "IN") and t[s+2].match("night")):
             append = "pm"
-            t[1].sem = "IGN"
-            t[2].sem = "IGN"
+            end_tok = s+2
         if append != "":
-            t[0].val += append
-            t[0].sem = "TIME"
-            t[0].pos = "TIME"
-            return [t[0]]
-
-    # (next) (weekday)
-    if (t[0].match("next", "JJ") and t[1].match(weekday_to_num)):
-        val = parse_date_to_norm(t[1].val)
+            val = parse_time_value(t[s].val + append)
+            if val:
+                for i in range(s+1, end_tok+1):
+                    t[i].sem = "IGN"
+                t[s].time = val
+                t[s].sem = "TIME"
+                t[s].pos = "TIME"
+                return [t[s]]
+
+
+def rule_next_weekday(t: list, s: int, today: date) -> list:
+    """(next) (weekday)"""
+    if (t[s].match("next", "JJ") and t[s+1].match(weekday_to_num)):
+        val = parse_date_value(t[s+1].val, today)
         if val:
-            t[1].sem = "IGN"
-            return [EToken(val, "DATE", "DATE")]
+            t[s+1].sem = "IGN"
+            return [date_token(t[s+1].orig, val)]
 
-    # time/date range
-    res = parse_time_date_range(t[0], t[1])
-    if res:
-        return res
 
-    # (month) (comma or THE - optional) (OD or CD) (comma - optional)
-    # (CD - optional - year)
-    d = 1
+def rule_time_date_range(t: list, s: int, today: date) -> list:
+    """A single time, date, time range or date range, possibly with
+    an am/pm or o'clock after it; see parse_time_date_range()"""
+    return parse_time_date_range(t[s], t[s+1], today)
+
+
+def rule_month_day(t: list, s: int, today: date) -> list:
+    """(month) (comma or THE - optional) (OD or CD) (comma - optional)
+    (CD - optional - year)"""
+    d = s+1
     if (t[d].match(",", pos=",") or t[d].match("the", "DT")):
         d += 1
-    if (t[0].match(month_to_num) and t[d].match(pos=["CD", "OD"])):
+    if (t[s].match(month_to_num) and t[d].match(pos=["CD", "OD"])):
         y = d+1
         res = None
         if t[y].match(",", pos=","):
             y += 1
         if t[y].match(pos="CD"):
-            res = parse_spelled_date(t[0], t[d], t[y])
+            res = parse_spelled_date(t[s], t[d], t[y])
             end_tok = y
         if res is None:
-            res = parse_spelled_date(t[0], t[d], None)
+            res = parse_spelled_date(t[s], t[d], None)
             end_tok = d
         if res:
-            for i in range(1, end_tok+1):
+            for i in range(s+1, end_tok+1):
                 t[i].sem = "IGN"
-            return [EToken(res, "DATE", "DATE")]
+            return [date_token(t[s].orig, res)]
+
 
-    # (THE - opt) (OD | CD day) (comma | OF - opt) (month)
-    # (comma - opt) (CD - opt year)
-    d = 0
+def rule_day_month(t: list, s: int, today: date) -> list:
+    """(THE - opt) (OD | CD day) (comma | OF - opt) (month)
+    (comma - opt) (CD - opt year)"""
+    d = s
     if (t[d].match("the", "DT")):
         d += 1
     m = d+1
@@ -556,16 +810,108 @@ def collapse_expand_tokens(token_list: list) -> list:
             res = parse_spelled_date(t[m], t[d], None)
             end_tok = m
         if res:
-            for i in range(1, end_tok+1):
+            for i in range(s+1, end_tok+1):
                 t[i].sem = "IGN"
-            return [EToken(res, "DATE", "DATE")]
+            return [date_token(t[s].orig, res)]
+
+
+def rule_the_ordinal(t: list, s: int, today: date) -> list:
+    """(the) (OD)"""
+    if (t[s].match("the", "DT") and t[s+1].match(pos="OD")):
+        val = parse_monthday_value(t[s+1].val)
+        if val:
+            t[s+1].sem = "IGN"
+            return [date_token(t[s+1].orig, val)]
+
+
+collapse_rules = [
+    Rule("ignored", rule_ignored),
+    Rule("possessive", rule_possessive, [(None, ["NNP"])]),
+    Rule("time_of_day", rule_time_of_day, [(None, ["CD"])]),
+    Rule("next_weekday", rule_next_weekday, [(["next"], ["JJ"])]),
+    Rule("time_date_range", rule_time_date_range,
+         [([digit_start, noon_start] + list(weekday_to_num) +
+           list(day_offsets), None)]),
+    Rule("month_day", rule_month_day, [(list(month_to_num), None)]),
+    Rule("day_month", rule_day_month,
+         [(["the"], ["DT"]), (None, ["CD", "OD"])]),
+    Rule("the_ordinal", rule_the_ordinal, [(["the"], ["DT"])])]
+
+
+def collapse_expand_tokens(token_list: list, s: int = 0,
+                           today: date = None) -> list:
+    """Collapse and expand the token list as the first phase of processing.
 
-    # (the) (OD)
-    if (t[0].match("the", "DT") and t[1].match(pos="OD")):
-        t[1].sem = "IGN"
-        return [EToken(f"reldate:monthday:{t[1].val}", "DATE", "DATE")]
+    On input, look at the string of tokens starting at token_list[s].
+    Return a list containing 0-N output tokens.
+
+    token_list is not copied, so callers stepping through a long list
+    should pad it once with padded(), to at least rule_window tokens
+    past the last position; otherwise the tail is padded here on
+    every call.
+
+    Dates are relative to the reference date today (default: that of
+    the module's clock).
 
-    return [t[0]]
+    Makes the following substitutions, through the rules in
+    collapse_rules, which are tried in order until one fires. Only the
+    rules that can start on token_list[s] are tried; see Rule.starts.
+
+     1) Concatenates a possessive token with the preceeding noun, so
+        for instance the token stream "Doug/NNP" and "'s/POS" will be
+        turned into the single token "Doug's/NNP"
+
+     5) For a string of tokens following the form
+           (time) in the ("morning" | "afternoon" | "evening")
+           (time) at night
+        returns a single token representing the time.
+
+     6) For the string of tokens
+           next (weekday)
+        returns a single token representing the date.
+
+     2) For a single token which appears to be of the form
+        (time)-(time) or (date)-(date), return three tokens: (start)
+        (UNTIL) (end), with "start" and "end" simplified for future
+        processing. (*)
+
+     3) For two tokens which appear to be of the form (time) (am/pm),
+        returns a single token representing the time. (*)
+
+     4) For a single token which can be unambiguously parsed as either
+        a time or date, returns a single token representing the
+        time/date in processed form (*)
+
+     7) Collapses the following strings of date tokens into a single
+        token representing the date:
+           (day) (spelled-month) (year)
+           (day) (spelled-month)
+           (spelled-month) (day)
+           (spelled-month) (day) (comma) (year)
+
+     8) Collapses the two token string "the" (OD) (as in "the 21st")
+        into a single token representing this as a date.
+
+     (* - these substitutions handled by parse_time_date_range)
+
+    """
+    t = token_list
+    if len(t) < s + rule_window:
+        t = padded(t, s + rule_window)
+
+    rules = rules_for(start_key(t[s]), collapse_rules, collapse_dispatch)
+    if rule_stats_enabled:
+        for rule in rules:
+            res = rule.counted(t, s, today)
+            if res is not None:
+                return res
+    else:
+        for rule in rules:
+            res = rule.func(t, s, today)
+            if res is not None:
+                return res
+
+    return [t[s]]
 
 
 def date_from_day(day_num: int, anchor: date) -> str:
@@ -579,35 +925,41 @@ def date_from_day(day_num: int, anchor: date) -> str:
     return date(anchor.year, anchor.month+1, day_num)
 
 
-def norm_to_date(t: EToken, hint_date: date = today) -> date:
-    """Convert a token containing a normalized date into the corresponding
-    datetime.date.
+def norm_to_date(t: EToken, hint_date: date = None) -> date:
+    """Convert a DATE token into the corresponding datetime.date.
 
-    hint_date (default: today) is a minimum. If the token is a
-    reldate, then it will be adjusted to come after hint_date.
+    hint_date (default: the reference date of the module's clock) is a
+    minimum. If the token's date is not ABS, then it will be adjusted
+    to come after hint_date. Results are memoized on the token's date
+    and hint_date.
     """
     assert(t.pos == "DATE")
-    m = re.fullmatch(r"absdate:(\d{2})/(\d{2})/(\d{4})", t.val)
-    if m:
-        return date(int(m.group(3)), int(m.group(1)), int(m.group(2)))
+    val = t.date
+    assert val is not None, t
 
-    m = re.fullmatch(r"reldate:weekday:(\d)", t.val)
-    if m:
-        delta = int(m.group(1)) - hint_date.weekday()
+    if val.kind == ABS:
+        return date(val.year, val.month, val.day)
+
+    if hint_date is None:
+        hint_date = reference_time().date()
+    return value_to_date(val, hint_date)
+
+
+@lru_cache(maxsize=memo_size)
+def value_to_date(val: DateValue, hint_date: date) -> date:
+    """Return the date of the DateValue val, which is not ABS, that
+    comes after hint_date, as for norm_to_date()"""
+    if val.kind == WEEKDAY:
+        delta = val.weekday - hint_date.weekday()
         if delta <= 0:
             delta += 7
         return hint_date + timedelta(days=delta)
 
-    m = re.fullmatch(r"reldate:monthday:(\d{1,2})", t.val)
-    if m:
-        return date_from_day(int(m.group(1)), hint_date)
+    if val.kind == MONTHDAY:
+        return date_from_day(val.day, hint_date)
 
-    m = re.fullmatch(r"reldate:(\d{2})/(\d{2})", t.val)
-    if not m:
-        assert False, t.val
-
-    month = int(m.group(1))
-    day = int(m.group(2))
+    month = val.month
+    day = val.day
     trial_date = date(hint_date.year, month, day)
     if (trial_date < hint_date):
         return date(hint_date.year + 1, month, day)
@@ -618,38 +970,34 @@ def norm_to_date(t: EToken, hint_date: date = today) -> date:
 def norm_to_time(t: EToken,
                  hint: time = None,
                  relation: str = "after") -> time:
-    """Convert a token containing a normalized time into the corresponding
-    datetime.time.
+    """Convert a TIME token into the corresponding datetime.time.
 
-    hint (default: noon) is a target time. If the token is a reltime,
-    its am/pm will be interpreted so as to get as close as possible to
-    hint.
+    hint (default: noon) is a target time. If the token's time is
+    relative, its am/pm will be interpreted so as to get as close as
+    possible to hint.
 
     relation is one of "after" (the default), "before", or
-    "nearest". If the token is a reltime, then relation determines how
-    the hint is interpreted. In the following examples, assume t is
-    "reltime:11:00:00" and hint is 3:00 pm:
+    "nearest". If the token's time is relative, then relation
+    determines how the hint is interpreted. In the following
+    examples, assume t is 11:00 (relative) and hint is 3:00 pm:
        "after" -> returns 11:00 pm
        "before" -> returns 11:00 am
        "nearest" -> returns 11:00 am
     """
     assert t.pos == "TIME"
     assert relation in ["after", "before", "nearest"], relation
-    m = re.fullmatch(r"(abs|rel)time:(\d{2}):(\d{2}):(\d{2})", t.val)
-    if not m:
-        assert False, t
+    val = t.time
+    assert val is not None, t
 
     if hint is None:
         hint = time(12)
 
-    hour = int(m.group(2))
-    minute = int(m.group(3))
-    second = int(m.group(4))
+    hour = val.hour
 
     # TODO: should also handle the case of wrapping aorund midnight,
     # but this requires modifying the end or start date, as well
 
-    if m.group(1) == "rel":
+    if not val.absolute:
         assert 1 <= hour <= 12, t
         if relation == "nearest":
             am_dist = abs(hour - hint.hour)
@@ -663,7 +1011,7 @@ def norm_to_time(t: EToken,
             if hour + 12 < hint.hour:
                 hour += 12
 
-    return time(hour, minute, second)
+    return time(hour, val.minute, val.second)
 
 
 def match_until(t: EToken) -> bool:
@@ -672,71 +1020,73 @@ def match_until(t: EToken) -> bool:
             t.match(["until", "til", "till", "thru", "through"]))
 
 
-def parse_phrase(tok_list: list):
-    """Parse for multi-word phrases.
+# The rules of the phrase pass. Each looks at the tokens starting at
+# t[s], where t is padded as for parse_phrase(), and updates them in
+# place. A rule that fires returns True, and ends the search at s.
 
-    When called, examine the provided string of tokens. The list is
-    guaranteed to have one element -- e.g., t[0] is guaranteed to
-    exist. Other tokens might not be present.
-    """
-
-    t = padded(tok_list, 10)
-
-    # (from - optional) (time | CD) (until) (time | CD)
-    m = 0
-    if t[0].match("from", "IN"):
+def rule_time_range(t: list, s: int, now: datetime) -> bool:
+    """(from - optional) (time | CD) (until) (time | CD)"""
+    m = s
+    if t[s].match("from", "IN"):
         m += 1
     if (t[m].match(pos=["TIME", "CD"]) and match_until(t[m+1]) and
         t[m+2].match(pos=["TIME", "CD"])):
-        st = parse_time_to_norm(t[m].val)
-        end = parse_time_to_norm(t[m+2].val)
+        st = token_time(t[m])
+        end = token_time(t[m+2])
         if st is not None and end is not None:
-            if t[0].match("from"):
-                t[0].sem = "IGN"
-            t[m].val = st
+            if t[s].match("from"):
+                t[s].sem = "IGN"
+            t[m].time = st
             t[m].sem = "ST_TIME"
             t[m].pos = "TIME"
             t[m+1].sem = "IGN"
-            t[m+2].val = end
+            t[m+2].time = end
             t[m+2].sem = "END_TIME"
             t[m+2].pos = "TIME"
-            return
+            return True
+
 
-    # (from - optional) (date) (until) (date | CD)
-    m = 0
-    if t[0].match("from", "IN"):
+def rule_date_range(t: list, s: int, now: datetime) -> bool:
+    """(from - optional) (date) (until) (date | CD)"""
+    m = s
+    if t[s].match("from", "IN"):
         m += 1
     if (t[m].match(pos="DATE") and match_until(t[m+1]) and
         t[m+2].match(pos=["DATE", "CD", "OD"])):
-        st = parse_date_to_norm(t[m].val)
+        today = now.date()
+        st = token_date(t[m], today)
         if t[m+2].match(pos=["CD", "OD"]):
-            end = f"reldate:monthday:{t[m+2].val}"
+            end = parse_monthday_value(t[m+2].val)
         else:
-            end = parse_date_to_norm(t[m+2].val)
+            end = token_date(t[m+2], today)
         if st is not None and end is not None:
-            if t[0].match("from"):
-                t[0].sem = "IGN"
-            t[m].val = st
+            if t[s].match("from"):
+                t[s].sem = "IGN"
+            t[m].date = st
             t[m].sem = "ST_DATE"
             t[m].pos = "DATE"
             t[m+1].sem = "IGN"
-            t[m+2].val = end
+            t[m+2].date = end
             t[m+2].sem = "END_DATE"
             t[m+2].pos = "DATE"
-            return
+            return True
 
-    # (on) (date)
-    if (t[0].match("on", "IN") and t[1].match(pos="DATE")):
-        st = parse_date_to_norm(t[1].val)
+
+def rule_on_date(t: list, s: int, now: datetime) -> bool:
+    """(on) (date)"""
+    if (t[s].match("on", "IN") and t[s+1].match(pos="DATE")):
+        st = token_date(t[s+1], now.date())
         if st is not None:
-            t[0].sem = "IGN"
-            t[1].val = st
-            t[1].sem = "ST_DATE"
-            return
-
-    # (in)? (a or CD) (week | month | day)  (from (date) - optional)
-    m = 0
-    if t[0].match("IN", "IN"):
+            t[s].sem = "IGN"
+            t[s+1].date = st
+            t[s+1].sem = "ST_DATE"
+            return True
+
+
+def rule_in_units(t: list, s: int, now: datetime) -> bool:
+    """(in)? (a or CD) (week | month | day)  (from (date) - optional)"""
+    m = s
+    if t[s].match("IN", "IN"):
         m += 1
     if ((t[m].match("a", "DT") or t[m].match(pos="CD")) and
         t[m+1].match(week_txt + month_txt + day_txt)):
@@ -745,134 +1095,296 @@ def parse_phrase(tok_list: list):
         else:
             num = int(t[m].val)
         if (t[m+2].match("from", "IN") and t[m+3].match(pos="DATE")):
-            anchor = norm_to_date(t[m+3])
+            anchor = norm_to_date(t[m+3], now.date())
             end_tok = m+3
         else:
-            anchor = today
+            anchor = now.date()
             end_tok = m+1
 
         if (t[m+1].match(week_txt)):
             dt = anchor + timedelta(weeks=num)
         elif (t[m+1].match(month_txt)):
-            dt = anchor + relativedelta.relativedelta(months=num)
+            dt = add_months(anchor, num)
         else:   # days
             dt = anchor + timedelta(days=num)
 
-        for i in range(0, end_tok+1):
+        for i in range(s, end_tok+1):
             t[i].sem = "IGN"
 
-        t[m].val = dt.strftime("absdate:%m/%d/%Y")
+        t[m].date = DateValue.from_date(dt)
         t[m].pos = "DATE"
         t[m].sem = "DATE"
-        return
+        return True
+
 
-    # (DT or CD) (week | month | day) (after) (date)
-    if (t[0].match(pos=["DT", "CD"]) and
-        t[1].match(week_txt + month_txt + day_txt) and
-        t[2].match("after", "IN") and t[3].match(pos="DATE")):
-        if t[0].pos == "DT":
+def rule_units_after(t: list, s: int, now: datetime) -> bool:
+    """(DT or CD) (week | month | day) (after) (date)"""
+    if (t[s].match(pos=["DT", "CD"]) and
+        t[s+1].match(week_txt + month_txt + day_txt) and
+        t[s+2].match("after", "IN") and t[s+3].match(pos="DATE")):
+        if t[s].pos == "DT":
             num = 1
         else:
-            num = int(t[0].val)
-        anchor = norm_to_date(t[3])
+            num = int(t[s].val)
+        anchor = norm_to_date(t[s+3], now.date())
 
-        if (t[1].match(week_txt)):
+        if (t[s+1].match(week_txt)):
             dt = anchor + timedelta(weeks=num)
-        elif (t[1].match(month_txt)):
-            dt = anchor + relativedelta.relativedelta(months=num)
+        elif (t[s+1].match(month_txt)):
+            dt = add_months(anchor, num)
         else:   # days
             dt = anchor + timedelta(days=num)
 
-        for i in range(0, 4):
+        for i in range(s, s+4):
             t[i].sem = "IGN"
-        t[1].val = dt.strftime("absdate:%m/%d/%Y")
-        t[1].pos = "DATE"
-        t[1].sem = "DATE"
-        return
-
-    # (in) (CD) (minutes | hours) - return both date and time
-    if (t[0].match("in", "IN") and t[1].match(pos="CD") and
-        t[2].match(minute_txt + hour_txt)):
-        val = float(t[1].val)
-        if t[2].match(hour_txt):
+        t[s+1].date = DateValue.from_date(dt)
+        t[s+1].pos = "DATE"
+        t[s+1].sem = "DATE"
+        return True
+
+
+def rule_in_minutes(t: list, s: int, now: datetime) -> bool:
+    """(in) (CD) (minutes | hours) - return both date and time"""
+    if (t[s].match("in", "IN") and t[s+1].match(pos="CD") and
+        t[s+2].match(minute_txt + hour_txt)):
+        val = float(t[s+1].val)
+        if t[s+2].match(hour_txt):
             val *= 60
-        dt = datetime.now() + timedelta(minutes=int(val))
-        t[0].val = dt.strftime("absdate:%m/%d/%Y")
-        t[0].pos = "DATE"
-        t[0].sem = "ST_DATE"
-        t[1].val = dt.strftime("abstime:%H:%M:00")
-        t[1].pos = "TIME"
-        t[1].sem = "ST_TIME"
-        t[2].sem = "IGN"
-        return
-
-    # (for) (CD) (minutes | hours) - duration
-    if (t[0].match("for", "IN") and t[1].match(pos="CD") and
-        t[2].match(minute_txt + hour_txt)):
-        val = float(t[1].val)
-        if t[2].match(hour_txt):
+        dt = now + timedelta(minutes=int(val))
+        t[s].date = DateValue.from_date(dt)
+        t[s].pos = "DATE"
+        t[s].sem = "ST_DATE"
+        t[s+1].time = TimeValue(True, dt.hour, dt.minute)
+        t[s+1].pos = "TIME"
+        t[s+1].sem = "ST_TIME"
+        t[s+2].sem = "IGN"
+        return True
+
+
+def rule_duration(t: list, s: int, now: datetime) -> bool:
+    """(for) (CD) (minutes | hours) - duration"""
+    if (t[s].match("for", "IN") and t[s+1].match(pos="CD") and
+        t[s+2].match(minute_txt + hour_txt)):
+        val = float(t[s+1].val)
+        if t[s+2].match(hour_txt):
             val *= 60
-        t[0].sem = "IGN"
-        t[1].val = str(int(val))
-        t[1].pos = "TIME"
-        t[1].sem = "DURATION"
-        t[2].sem = "IGN"
-        return
-
-    # (at|in) (a location phrase)
-    #
-    # This was originally more complicated and less accurate. For our
-    # purposes, a location phrase can (1) optional start with DT, PRP,
-    # PRP$; and (2) is any consecutive run of nouns, adjectives, CD,
-    # OD, and comma. HOWEVER, the location phrase MUST have at least
-    # one noun or adjective; if not don't trigger this rule
-    noun_pos = ["NN", "NNS", "NNP", "NNPS"]
-    adjective_pos = ["JJ", "JJR", "JJS"]
-    na_pos = noun_pos + adjective_pos
-    loc_pos = noun_pos + adjective_pos + [",", "CD", "OD"]
-    n = 1
-    if t[1].match(pos=["DT", "PRP", "PRP$"], sem="-"):
+        t[s].sem = "IGN"
+        t[s+1].val = str(int(val))
+        t[s+1].pos = "TIME"
+        t[s+1].sem = "DURATION"
+        t[s+2].sem = "IGN"
+        return True
+
+
+noun_pos = ["NN", "NNS", "NNP", "NNPS"]
+adjective_pos = ["JJ", "JJR", "JJS"]
+na_pos = noun_pos + adjective_pos
+loc_pos = noun_pos + adjective_pos + [",", "CD", "OD"]
+
+
+def rule_location(t: list, s: int, now: datetime) -> bool:
+    """(at|in) (a location phrase)
+
+    This was originally more complicated and less accurate. For our
+    purposes, a location phrase can (1) optional start with DT, PRP,
+    PRP$; and (2) is any consecutive run of nouns, adjectives, CD,
+    OD, and comma. HOWEVER, the location phrase MUST have at least
+    one noun or adjective; if not don't trigger this rule
+    """
+    n = s+1
+    if t[s+1].match(pos=["DT", "PRP", "PRP$"], sem="-"):
         n += 1
-    if (t[0].match(["at", "in"], "IN") and t[n].match(pos=loc_pos, sem="-")):
+    if (t[s].match(["at", "in"], "IN") and t[n].match(pos=loc_pos, sem="-")):
         while t[n].match(pos=loc_pos, sem="-"):
             n += 1
         # n now points to one past the end token
 
         # see if we have at least one noun/adj
         na_count = 0
-        for i in range(1, n):
+        for i in range(s+1, n):
             if t[i].match(pos=na_pos):
                 na_count += 1
 
         if na_count > 0:
-            t[0].sem = "IGN"
-            for i in range(1, n):
+            t[s].sem = "IGN"
+            for i in range(s+1, n):
                 t[i].sem = "LOCATION"
             # If the last token in the noun phrase is a comma, ignore it
             if t[n-1].match(pos=","):
                 t[n-1].sem = "IGN"
-            return
+            return True
+
 
-    # (at) (CD) (CD), try it as a time ("at seven thirty")
-    if (t[0].match("at", "IN") and t[1].match(pos="CD") and
-        t[2].match(pos="CD")):
-        st = parse_time_to_norm(f"{t[1].val}:{t[2].val}")
+def rule_at_cd_cd(t: list, s: int, now: datetime) -> bool:
+    """(at) (CD) (CD), try it as a time ("at seven thirty")"""
+    if (t[s].match("at", "IN") and t[s+1].match(pos="CD") and
+        t[s+2].match(pos="CD")):
+        st = parse_time_value(f"{t[s+1].val}:{t[s+2].val}")
         if st is not None:
-            t[0].sem = "IGN"
-            t[1].val = st
-            t[1].sem = "ST_TIME"
-            t[1].pos = "TIME"
-            t[2].sem = "IGN"
-
-    # (at) (time or CD)
-    if (t[0].match("at", "IN") and t[1].match(pos=["TIME", "CD"])):
-        st = parse_time_to_norm(t[1].val)
+            t[s].sem = "IGN"
+            t[s+1].time = st
+            t[s+1].sem = "ST_TIME"
+            t[s+1].pos = "TIME"
+            t[s+2].sem = "IGN"
+            return True
+
+
+def rule_at_time(t: list, s: int, now: datetime) -> bool:
+    """(at) (time or CD)"""
+    if (t[s].match("at", "IN") and t[s+1].match(pos=["TIME", "CD"])):
+        st = token_time(t[s+1])
         if st is not None:
-            t[0].sem = "IGN"
-            t[1].val = st
-            t[1].sem = "ST_TIME"
-            t[1].pos = "TIME"
-            return
+            t[s].sem = "IGN"
+            t[s+1].time = st
+            t[s+1].sem = "ST_TIME"
+            t[s+1].pos = "TIME"
+            return True
+
+
+phrase_rules = [
+    Rule("time_range", rule_time_range,
+         [(["from"], ["IN"]), (None, ["TIME", "CD"])]),
+    Rule("date_range", rule_date_range,
+         [(["from"], ["IN"]), (None, ["DATE"])]),
+    Rule("on_date", rule_on_date, [(["on"], ["IN"])]),
+    Rule("in_units", rule_in_units,
+         [(["IN"], ["IN"]), (["a"], ["DT"]), (None, ["CD"])]),
+    Rule("units_after", rule_units_after, [(None, ["DT", "CD"])]),
+    Rule("in_minutes", rule_in_minutes, [(["in"], ["IN"])]),
+    Rule("duration", rule_duration, [(["for"], ["IN"])]),
+    Rule("location", rule_location, [(["at", "in"], ["IN"])]),
+    Rule("at_cd_cd", rule_at_cd_cd, [(["at"], ["IN"])]),
+    Rule("at_time", rule_at_time, [(["at"], ["IN"])])]
+
+
+# The words that some rule can start on, as named in Rule.starts
+start_words = {val for rule in collapse_rules + phrase_rules
+               for (vals, poss) in (rule.starts or [])
+               for val in (vals or [])} - {digit_start, noon_start}
+
+
+def start_key(tok: EToken) -> tuple:
+    """Return the (value class, pos) key for which rules can start on
+    tok: the value class is tok.val if it is in start_words, else
+    digit_start or noon_start if it begins with one of those, else
+    None."""
+    val = tok.val
+    if val not in start_words:
+        if val[:1].isdigit():
+            val = digit_start
+        elif val.startswith(("noon", "midnight")):
+            val = noon_start
+        else:
+            val = None
+    return (val, tok.pos)
+
+
+# For each pass, a table from start_key() to the tuple of rules that
+# can start there, in order. Filled in as keys are seen; there are
+# only as many keys as start classes times parts of speech.
+collapse_dispatch = {}
+phrase_dispatch = {}
+
+
+def rules_for(key: tuple, rules: list, dispatch: dict) -> tuple:
+    """Return the rules, of the pass with the given rules and dispatch
+    table, that can start on a token with start_key() key"""
+    res = dispatch.get(key)
+    if res is None:
+        res = tuple(rule for rule in rules if rule.can_start(key))
+        dispatch[key] = res
+    return res
+
+
+def parse_phrase(tok_list: list, s: int = 0, now: datetime = None):
+    """Parse for multi-word phrases.
+
+    When called, examine the provided string of tokens, starting at
+    tok_list[s]. The list is guaranteed to have that element. Other
+    tokens might not be present.
+
+    As for collapse_expand_tokens(), tok_list is not copied, and
+    callers stepping through a long list should pad it once with
+    padded().
+
+    Relative dates and times are computed from the reference time now
+    (default: the module's clock).
+
+    The phrases are found by the rules in phrase_rules, which are tried
+    in order until one fires. As in collapse_expand_tokens(), only the
+    rules that can start on tok_list[s] are tried.
+    """
+
+    now = reference_time(now)
+    t = tok_list
+    if len(t) < s + rule_window:
+        t = padded(t, s + rule_window)
+
+    rules = rules_for(start_key(t[s]), phrase_rules, phrase_dispatch)
+    if rule_stats_enabled:
+        for rule in rules:
+            if rule.counted(t, s, now) is not None:
+                return
+    else:
+        for rule in rules:
+            if rule.func(t, s, now) is not None:
+                return
+
+
+def enable_rule_stats(enabled: bool = True) -> None:
+    """Start (or with enabled False, stop) counting, for each rule of
+    both passes, how often it is attempted, how often it fires and the
+    time spent in it. While disabled, the rules run uncounted, at no
+    extra cost. The counts are not locked, so they are approximate if
+    several threads parse at once.
+    """
+    global rule_stats_enabled
+    rule_stats_enabled = enabled
+
+
+def reset_rule_stats() -> None:
+    """Zero the counters of every rule"""
+    for rule in collapse_rules + phrase_rules:
+        rule.reset()
+
+
+def rule_stats() -> dict:
+    """Return the rule counters, as a dict mapping each pass,
+    "collapse" and "phrase", to a dict mapping each of its rule names,
+    in order, to a dict of attempts, fires and seconds.
+    """
+    return {name: {rule.name: {"attempts": rule.attempts,
+                               "fires": rule.fires,
+                               "seconds": rule.seconds}
+                   for rule in rules}
+            for (name, rules) in (("collapse", collapse_rules),
+                                  ("phrase", phrase_rules))}
+
+
+# the memoized value parsers, reported by memo_stats()
+memo_functions = [parse_time_value, date_value, value_to_date]
+
+
+def memo_stats() -> dict:
+    """Return, for each memoized value parser by name, a dict of its
+    hits, misses, size, maxsize and hit_rate (hits over calls, or 0.0
+    before any call).
+    """
+    res = {}
+    for func in memo_functions:
+        info = func.cache_info()
+        calls = info.hits + info.misses
+        res[func.__name__] = {"hits": info.hits, "misses": info.misses,
+                              "size": info.currsize,
+                              "maxsize": info.maxsize,
+                              "hit_rate": info.hits / calls if calls else 0.0}
+    return res
+
+
+def clear_memos() -> None:
+    """Empty the memos of the value parsers, and zero their statistics"""
+    for func in memo_functions:
+        func.cache_clear()
 
 
 def find_default_time_for_event(title_toks: list) -> time:
@@ -907,19 +1419,23 @@ def clean_punctuation(s: str) -> str:
 
     Return the cleaned-up string
     """
-    s = re.sub(" ([,.!'])", r"\1", s)
-    s = re.sub(" `` ", " \"", s)
-    s = re.sub("''", "\"", s)
-    s = re.sub("^[,.] ", "", s)
-    s = re.sub("[,.!]$", "", s)
+    s = punct_space_re.sub(r"\1", s)
+    s = open_quote_re.sub(" \"", s)
+    s = close_quote_re.sub("\"", s)
+    s = leading_punct_re.sub("", s)
+    s = trailing_punct_re.sub("", s)
     return s
 
 
-def compute_dates_and_times(d: dict) -> tuple:
-    """Given the processed tokens, compute dates and times.
+def compute_dates_and_times(d: dict, today: date = None) -> tuple:
+    """Given the processed tokens, compute dates and times, relative to
+    the reference date today (default: that of the module's clock).
 
     Returns tuple (st_date, end_date, st_time, end_time)"""
 
+    if today is None:
+        today = reference_time().date()
+
     # sometimes start/end date or time was not specified, but we have
     # multiple generic date or time tokens; in this case the first is
     # the start and the second, if present, is the end
@@ -946,10 +1462,10 @@ def compute_dates_and_times(d: dict) -> tuple:
     default_time = None
 
     if "ST_DATE" in d:
-        st_date = norm_to_date(d["ST_DATE"][0])
+        st_date = norm_to_date(d["ST_DATE"][0], today)
 
     if "END_DATE" in d:
-        end_date = norm_to_date(d["END_DATE"][0], st_date)
+        end_date = norm_to_date(d["END_DATE"][0], st_date or today)
     elif st_date is not None:
         end_date = st_date
 
@@ -957,8 +1473,8 @@ def compute_dates_and_times(d: dict) -> tuple:
         # If the end time is absolute and the start time is relative,
         # evaluate end first so that we can provide end as a hint to
         # start. Otherwise do them in the normal order.
-        if (d["ST_TIME"][0].val.startswith("reltime:") and "END_TIME" in d and
-            d["END_TIME"][0].val.startswith("abstime:")):
+        if (not d["ST_TIME"][0].time.absolute and "END_TIME" in d and
+            d["END_TIME"][0].time.absolute):
             end_time = norm_to_time(d["END_TIME"][0])
             st_time = norm_to_time(d["ST_TIME"][0], end_time, "before")
         else:
@@ -982,7 +1498,8 @@ def compute_dates_and_times(d: dict) -> tuple:
     return (st_date, end_date, st_time, end_time)
 
 
-def parse_event(raw: str, debug: bool = False, log: bool = False):
+def parse_event(raw: str, debug: bool = False, log: bool = False,
+                tagger: str = None, now=None, timing=None):
     """Parse a natural language string to a calendar event.
 
     Returns (start_date, end_date, start_time, end_time, title,
@@ -1018,48 +1535,312 @@ def parse_event(raw: str, debug: bool = False, log: bool = False):
     stdout.
 
     if log is True, then the original raw query will be saved as a
-    single line to the log file (for later use as a test case)
+    single line to the log file (for later use as a test case); see
+    query_logger
+
+    tagger names the part-of-speech tagger engine to use (default:
+    tagger_engine); see taggers.py.
+
+    now is the reference time that relative dates and times, such as
+    "tomorrow" or "in 2 hours", are computed from: a datetime, a date,
+    or a function returning one, as for reference_time(). The default
+    is the module's clock, read once per call.
+
+    timing, if given, is called as timing(stage, seconds) with the time
+    taken by each stage of the parse, named as in stages. When it is
+    None, the stages are not timed at all. See StageTimes.
 
     Currently, the parser does not handle timezones or recurring
     events.
 
     """
 
+    start_parse(raw, debug, log)
+
+    if timing is not None:
+        t = perf_counter()
+
+    # tokenize our input
+    tokenized = word_tokenize(raw)
+    if timing is not None:
+        t = lap(timing, "tokenize", t)
+
+    tagged_words = pos_tagger(tagger).tag(tokenized)
+    if timing is not None:
+        lap(timing, "pos_tag", t)
+
+    return parse_tagged(tagged_words, debug, now, timing)
+
+
+def parse_events(phrases, debug: bool = False, log: bool = False,
+                 tagger: str = None, now=None, timing=None) -> list:
+    """Parse an iterable of natural language strings to calendar events.
+
+    Returns a list holding, for each phrase in order, the same tuple
+    that parse_event() would return for it. debug, log, tagger, now
+    and timing are as for parse_event(); now is read once, for the
+    whole batch, and the tokenize and pos_tag stages are timed once,
+    for the whole batch.
+
+    This is faster than calling parse_event() on each phrase, because
+    all of the phrases are part-of-speech tagged with a single call
+    to the tagger.
+    """
+    phrases = list(phrases)
+    now = reference_time(now)
+    for raw in phrases:
+        start_parse(raw, debug, log)
+
+    if timing is not None:
+        t = perf_counter()
+    tokenized = [word_tokenize(raw) for raw in phrases]
+    if timing is not None:
+        t = lap(timing, "tokenize", t)
+    tagged = pos_tagger(tagger).tag_sents(tokenized)
+    if timing is not None:
+        lap(timing, "pos_tag", t)
+    return [parse_tagged(tagged_words, debug, now, timing)
+            for tagged_words in tagged]
+
+
+# the names of the fields of the tuple returned by parse_event()
+event_fields = ("start_date", "end_date", "start_time", "end_time", "title",
+                "location")
+
+
+def event_to_dict(event: tuple) -> dict:
+    """Convert a tuple returned by parse_event() to a dict keyed by
+    event_fields, ready for JSON: dates and times become ISO 8601
+    strings ("2018-03-21", "14:30:00"), and missing values are None.
+    """
+    return {name: (val.isoformat() if isinstance(val, (date, time))
+                   else val)
+            for (name, val) in zip(event_fields, event)}
+
+
+def parse_stream(lines, out, chunksize: int = 256,
+                 flush_interval: float = 1.0, tagger: str = None,
+                 now=None) -> int:
+    """Parse an iterable of lines, one phrase per line, writing one
+    JSON object per line to the text file out, in input order.
+
+    Each object holds the phrase as "text", plus the event_to_dict()
+    fields, or "error" if the phrase could not be parsed. Lines are
+    read and tagged up to chunksize at a time, so memory use does not
+    grow with the input. out is flushed once flush_interval seconds
+    have passed since the last flush (0 flushes every chunk); lines are
+    read on a separate thread, so that when they arrive slowly, as from
+    a live pipe, a chunk is cut short at that deadline rather than
+    waiting to fill. tagger and now are as for parse_event(); if now is
+    not given, each chunk is parsed relative to the clock when it is
+    reached.
+
+    Returns the number of phrases parsed.
+    """
+    import queue
+    import threading
+    from time import monotonic
+
+    if chunksize < 1:
+        raise ValueError("chunksize must be >= 1")
+    # the lines, then any exception reading them, then end
+    lines_read = queue.Queue(maxsize=2 * chunksize)
+    end = object()
+
+    def read():
+        try:
+            for line in lines:
+                lines_read.put(line)
+        except Exception as e:
+            lines_read.put(e)
+        lines_read.put(end)
+
+    threading.Thread(target=read, daemon=True,
+                     name="parse_stream reader").start()
+    count = 0
+    last_flush = monotonic()
+    unflushed = False
+    finished = False
+    while not finished:
+        # wait for lines without limit, unless there are some to parse
+        # or output to flush by the deadline
+        chunk = []
+        while len(chunk) < chunksize:
+            timeout = None
+            if chunk or unflushed:
+                timeout = max(last_flush + flush_interval - monotonic(), 0)
+            try:
+                line = lines_read.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if line is end:
+                finished = True
+                break
+            if isinstance(line, Exception):
+                raise line
+            chunk.append(line.rstrip("\r\n"))
+        if chunk:
+            write_results(chunk, out, tagger, now)
+            count += len(chunk)
+            unflushed = True
+        if unflushed and monotonic() - last_flush >= flush_interval:
+            out.flush()
+            last_flush = monotonic()
+            unflushed = False
+    out.flush()
+    return count
+
+
+def write_results(chunk: list, out, tagger: str = None, now=None) -> None:
+    """Parse a list of phrases and write their results to out, as for
+    parse_stream()."""
+    import json
+
+    chunk_now = reference_time(now)
+    try:
+        results = parse_events(chunk, tagger=tagger, now=chunk_now)
+    except Exception:
+        # parse one at a time, to find the phrases at fault
+        results = []
+        for raw in chunk:
+            try:
+                results.append(parse_event(raw, tagger=tagger,
+                                           now=chunk_now))
+            except Exception as e:
+                results.append(e)
+    for (raw, res) in zip(chunk, results):
+        if isinstance(res, Exception):
+            obj = {"text": raw, "error": repr(res)}
+        else:
+            obj = {"text": raw, **event_to_dict(res)}
+        out.write(json.dumps(obj) + "\n")
+
+
+# phrases parsed by warmup(), which between them reach the tokenizer,
+# the tagger and the date arithmetic
+warmup_phrases = ["Lunch with Pat at Rosie's tomorrow from 12 to 1:30pm",
+                  "Trip to Boston in a month"]
+
+
+def warmup(tagger: str = None) -> None:
+    """Do ahead of time the work that would otherwise slow down the
+    first call to parse_event(): import NLTK and dateutil, load the
+    tokenizer and the named tagger engine (default: tagger_engine),
+    and run a few phrases through every stage of the parser. All of
+    the parser's patterns are already compiled when this module is
+    imported.
+    """
+    parse_events(warmup_phrases, tagger=tagger)
+
+
+def start_parse(raw: str, debug: bool, log: bool) -> None:
+    """Print and log the raw phrase, as requested by debug and log."""
     if (debug):
         print(f"parsing raw phrase: {raw}")
 
     if (log):
-        with open(logfile, 'a') as f:
-            f.write(f"{raw}\n")
+        logger = query_logger
+        if logger is None:
+            import query_log
+            logger = query_log.get_logger(logfile)
+        logger.log(raw)
 
-    # tokenize our input
-    tokenized = nltk.word_tokenize(raw)
-    temp_list = []
-    for t in nltk.pos_tag(tokenized):
-        tok = EToken(*t)
-        handle_spelled_number(tok)
-        if (tok.val == "@"):
-            tok = EToken("at", "IN")
-        temp_list.append(tok)
 
-    if (debug):
-        print(f"After tokenization: {temp_list}")
+# The stages of a parse, in order, as reported to a timing callback:
+#
+#   tokenize        splitting the phrase into words
+#   pos_tag         part-of-speech tagging
+#   tokens          making ETokens, with spelled-out numbers translated
+#   collapse        the collapse / expand rule pass
+#   phrase          the phrase rule pass
+#   dict            marking the title and grouping the tokens by sem
+#   title_location  assembling the title and location strings
+#   dates_times     compute_dates_and_times()
+stages = ["tokenize", "pos_tag", "tokens", "collapse", "phrase", "dict",
+          "title_location", "dates_times"]
+
+
+def lap(timing, stage: str, start: float) -> float:
+    """Report to timing the time since start taken by stage, and return
+    the time now, to start the next stage."""
+    end = perf_counter()
+    timing(stage, end - start)
+    return end
+
+
+class StageTimes():
+    """A timing callback for parse_event() that totals the time spent
+    in each stage over any number of calls:
+
+        times = StageTimes()
+        for raw in phrases:
+            parse_event(raw, timing=times)
+        print(times.report())
+    """
 
-    # First pass: collapse / expand
+    def __init__(self):
+        self.calls = dict.fromkeys(stages, 0)
+        self.seconds = dict.fromkeys(stages, 0.0)
+
+    def __call__(self, stage: str, seconds: float) -> None:
+        self.calls[stage] = self.calls.get(stage, 0) + 1
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def report(self) -> dict:
+        """Return, for each stage, a dict of the number of times it ran,
+        its total seconds, its mean seconds and its share of the total
+        time."""
+        total = sum(self.seconds.values()) or 1.0
+        report = {}
+        for (stage, calls) in self.calls.items():
+            secs = self.seconds[stage]
+            report[stage] = {"calls": calls, "seconds": secs,
+                             "mean": secs / max(calls, 1),
+                             "share": secs / total}
+        return report
+
+
+def make_token(tagged_word: tuple) -> EToken:
+    """Make the EToken for a (word, part of speech) tuple, translating
+    a spelled-out number to digits and "@" to "at"."""
+    tok = EToken(*tagged_word)
+    handle_spelled_number(tok)
+    if (tok.val == "@"):
+        tok = EToken("at", "IN")
+    return tok
+
+
+def make_tokens(tagged_words: list) -> list:
+    """Make the ETokens for a list of (word, part of speech) tuples; see
+    make_token()."""
+    return [make_token(t) for t in tagged_words]
+
+
+# The two rule passes each pad their list once and then step through it
+# by index, so the passes are linear in the number of tokens.
+
+def collapse_pass(temp_list: list, today: date = None) -> list:
+    """Run collapse_expand_tokens() at each position of temp_list, and
+    return the resulting list of tokens."""
     token_list = []
+    padded_list = padded(temp_list, len(temp_list) + rule_window)
     for i in range(len(temp_list)):
-        token_list.extend(collapse_expand_tokens(temp_list[i:]))
+        token_list.extend(collapse_expand_tokens(padded_list, i, today))
+    return token_list
 
-    if (debug):
-        print(f"Before parsing for phrases: {token_list}")
 
-    # Second pass: parse for phrases
+def phrase_pass(token_list: list, now: datetime = None) -> None:
+    """Run parse_phrase() at each position of token_list, which is
+    updated in place."""
+    padded_list = padded(token_list, len(token_list) + rule_window)
     for i in range(len(token_list)):
-        parse_phrase(token_list[i:])
+        parse_phrase(padded_list, i, now)
 
-    if (debug):
-        print(f"after phrase parsing: {token_list}")
 
+def sem_dict(token_list: list) -> dict:
+    """Mark the tokens left over by the rule passes as ignored ("is")
+    or as part of the title, and return a dict mapping each sem to the
+    list of its tokens, in order."""
     # ignore some remaining tokens, such as "is"
     for t in token_list:
         if t.match("is", sem="-"):
@@ -1077,10 +1858,12 @@ def parse_event(raw: str, debug: bool = False, log: bool = False):
             d[t.sem] = [t]
         else:
             d[t.sem].append(t)
+    return d
 
-    if (debug):
-        print(f"dict: {d}")
 
+def title_and_location(d: dict) -> tuple:
+    """Return (title, location) from the dict made by sem_dict(), each
+    None if absent."""
     if "TITLE" in d:
         title = clean_punctuation(" ".join([t.orig for t in d["TITLE"]]))
     else:
@@ -1091,7 +1874,60 @@ def parse_event(raw: str, debug: bool = False, log: bool = False):
     else:
         location = None
 
-    (st_date, end_date, st_time, end_time) = compute_dates_and_times(d)
+    return (title, location)
+
+
+def parse_tagged(tagged_words: list, debug: bool = False, now=None,
+                 timing=None):
+    """Parse one phrase, given as a list of (word, part of speech)
+    tuples as returned by the tagger, to a calendar event.
+
+    Returns the same tuple as parse_event(); now and timing are as for
+    parse_event().
+    """
+    now = reference_time(now)
+    today = now.date()
+
+    if timing is not None:
+        t = perf_counter()
+
+    temp_list = make_tokens(tagged_words)
+    if timing is not None:
+        t = lap(timing, "tokens", t)
+
+    if (debug):
+        print(f"After tokenization: {temp_list}")
+
+    # First pass: collapse / expand
+    token_list = collapse_pass(temp_list, today)
+    if timing is not None:
+        t = lap(timing, "collapse", t)
+
+    if (debug):
+        print(f"Before parsing for phrases: {token_list}")
+
+    # Second pass: parse for phrases
+    phrase_pass(token_list, now)
+    if timing is not None:
+        t = lap(timing, "phrase", t)
+
+    if (debug):
+        print(f"after phrase parsing: {token_list}")
+
+    d = sem_dict(token_list)
+    if timing is not None:
+        t = lap(timing, "dict", t)
+
+    if (debug):
+        print(f"dict: {d}")
+
+    (title, location) = title_and_location(d)
+    if timing is not None:
+        t = lap(timing, "title_location", t)
+
+    (st_date, end_date, st_time, end_time) = compute_dates_and_times(d, today)
+    if timing is not None:
+        lap(timing, "dates_times", t)
 
     ret = (st_date, end_date, st_time, end_time, title, location)
 
@@ -1099,3 +1935,45 @@ def parse_event(raw: str, debug: bool = False, log: bool = False):
         print(f"Returning: {ret}")
 
     return ret
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(
+        description="Parse natural language phrases to calendar events")
+    parser.add_argument("phrase", nargs="*",
+                        help="a phrase to parse (without --batch)")
+    parser.add_argument("--batch", nargs="?", const="-", metavar="FILE",
+                        help="parse one phrase per line of FILE (default: "
+                        "stdin), writing one JSON result per line")
+    parser.add_argument("--output", metavar="FILE",
+                        help="write results here (default: stdout)")
+    parser.add_argument("--chunksize", type=int, default=256,
+                        help="phrases tagged at a time (default: 256)")
+    parser.add_argument("--flush-interval", type=float, default=1.0,
+                        metavar="SECONDS",
+                        help="flush output at most this often (default: 1)")
+    parser.add_argument("--tagger", help="tagger engine (nltk or lite)")
+    parser.add_argument("--now", type=datetime.fromisoformat,
+                        help="ISO 8601 reference date or time "
+                        "(default: the clock)")
+    args = parser.parse_args()
+    if args.chunksize < 1:
+        parser.error("--chunksize must be at least 1")
+
+    if args.batch is None:
+        if not args.phrase:
+            parser.error("give a phrase, or --batch")
+        res = parse_event(" ".join(args.phrase), tagger=args.tagger,
+                          now=args.now)
+        print(json.dumps(event_to_dict(res)))
+        sys.exit(0)
+
+    infile = sys.stdin if args.batch == "-" else open(args.batch)
+    outfile = sys.stdout if args.output is None else open(args.output, "w")
+    with infile, outfile:
+        parse_stream(infile, outfile, args.chunksize, args.flush_interval,
+                     args.tagger, args.now)
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+#
+# event_parser_bench.py: Benchmarks for event_parser.py
+#
+# Copyright (C) 2018 Cardinal Peak LLC
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+phrase = "Coffee with Sam at Starbucks tomorrow at 10am"
+
+# The reference time the in-process benchmarks parse relative to, so
+# that every run takes the same paths through the date arithmetic.
+reference = datetime(2018, 6, 15, 12, 0)
+
+# Run in a fresh interpreter by bench_startup(). Prints the seconds
+# taken by each step, as JSON.
+startup_script = """
+import json, sys, time
+tagger = sys.argv[2] or None
+t0 = time.perf_counter()
+import event_parser
+t1 = time.perf_counter()
+if sys.argv[1] == "warm":
+    event_parser.warmup(tagger)
+t2 = time.perf_counter()
+event_parser.parse_event({phrase!r}, tagger=tagger)
+t3 = time.perf_counter()
+event_parser.parse_event({phrase!r}, tagger=tagger)
+t4 = time.perf_counter()
+print(json.dumps({{"import": t1 - t0, "warmup": t2 - t1,
+                  "first_parse": t3 - t2, "next_parse": t4 - t3}}))
+"""
+
+
+def bench_startup(runs: int = 5, tagger: str = None) -> dict:
+    """Measure startup costs, each in runs fresh interpreters.
+
+    Returns a dict of median times in seconds:
+        import        import event_parser
+        first_parse   the first parse_event() call, with no warmup()
+        warmup        event_parser.warmup()
+        warm_parse    the first parse_event() call after warmup()
+        next_parse    a later parse_event() call
+    """
+    script = startup_script.format(phrase=phrase)
+    here = os.path.dirname(os.path.abspath(__file__))
+    samples = {"cold": [], "warm": []}
+    for i in range(runs):
+        for mode in samples:
+            out = subprocess.run([sys.executable, "-c", script, mode,
+                                  tagger or ""], cwd=here, check=True,
+                                 capture_output=True, text=True).stdout
+            samples[mode].append(json.loads(out))
+
+    def median(mode, key):
+        return statistics.median(s[key] for s in samples[mode])
+
+    return {"import": median("cold", "import"),
+            "first_parse": median("cold", "first_parse"),
+            "warmup": median("warm", "warmup"),
+            "warm_parse": median("warm", "first_parse"),
+            "next_parse": median("cold", "next_parse")}
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Return the pct'th percentile (0-100) of a sorted list, by the
+    nearest-rank method."""
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def bench_throughput(phrases: list, repeat: int = 3, tagger: str = None,
+                     now: datetime = reference) -> dict:
+    """Time parse_event() on each phrase, repeat times over.
+
+    Returns a dict with the phrases parsed per second, and the mean,
+    p50 and p99 latency of a call in seconds.
+    """
+    import event_parser
+    event_parser.warmup(tagger)
+    latencies = []
+    start = time.perf_counter()
+    for i in range(repeat):
+        for raw in phrases:
+            t0 = time.perf_counter()
+            event_parser.parse_event(raw, tagger=tagger, now=now)
+            latencies.append(time.perf_counter() - t0)
+    total = time.perf_counter() - start
+    latencies.sort()
+    return {"calls": len(latencies),
+            "phrases_per_second": len(latencies) / total,
+            "mean": statistics.mean(latencies),
+            "p50": percentile(latencies, 50),
+            "p99": percentile(latencies, 99)}
+
+
+def time_per_call(func, args_list: list, repeat: int,
+                  reset=None) -> float:
+    """Return the mean seconds per call of func(*args) over args_list,
+    run repeat times, calling reset(), if given, untimed before each
+    pass."""
+    elapsed = 0.0
+    for i in range(repeat):
+        if reset:
+            reset()
+        start = time.perf_counter()
+        for args in args_list:
+            func(*args)
+        elapsed += time.perf_counter() - start
+    return elapsed / max(len(args_list) * repeat, 1)
+
+
+def time_stage(setup, stage, phrases: list, repeat: int,
+               reset=None) -> float:
+    """Return the mean seconds per phrase taken by stage(setup(p)) over
+    the phrases, run repeat times, timing only the stage. setup must
+    return fresh input each time, as the stages change their tokens.
+    reset(), if given, is called untimed after each setup()."""
+    elapsed = 0.0
+    for i in range(repeat):
+        for p in phrases:
+            arg = setup(p)
+            if reset:
+                reset()
+            t0 = time.perf_counter()
+            stage(arg)
+            elapsed += time.perf_counter() - t0
+    return elapsed / max(len(phrases) * repeat, 1)
+
+
+def bench_micro(phrases: list, repeat: int = 3, tagger: str = None,
+                now: datetime = reference) -> dict:
+    """Time the parser's inner functions on inputs made from phrases.
+
+    The time and date value parsers are given every word of the
+    phrases; parse_time_date_range() every word with the word after
+    it; and the rule passes and compute_dates_and_times() the state
+    of each phrase on reaching them. Returns a dict of mean seconds
+    per call, or per phrase for the passes.
+
+    The memos of the value parsers (see event_parser.memo_stats()) are
+    emptied before each pass over the words, and before each phrase
+    of the rule passes, so that these time the parser rather than the
+    memos; parse_time_value and date_value are timed without their
+    memos at all. memo_hit is the time of a parse_time_value() call
+    answered from its memo.
+    """
+    import event_parser as ep
+    from etoken import ETokenNull
+
+    today = now.date()
+    tagged = [ep.pos_tagger(tagger).tag(ep.word_tokenize(p)) for p in phrases]
+    words = [(w,) for tw in tagged for (w, pos) in tw]
+    pairs = []
+    for tw in tagged:
+        toks = ep.make_tokens(tw) + [ETokenNull()]
+        pairs.extend((tok, nxt, today) for (tok, nxt) in zip(toks, toks[1:]))
+
+    def collapsed(tw):
+        return ep.collapse_pass(ep.make_tokens(tw), today)
+
+    def phrased(tw):
+        token_list = collapsed(tw)
+        ep.phrase_pass(token_list, now)
+        return ep.sem_dict(token_list)
+
+    dated = [(w, today) for (w,) in words]
+    reset = ep.clear_memos
+    results = {
+        "parse_time_value": time_per_call(ep.parse_time_value.__wrapped__,
+                                          words, repeat),
+        "date_value": time_per_call(ep.date_value.__wrapped__, dated,
+                                    repeat),
+        "parse_time_to_norm": time_per_call(ep.parse_time_to_norm, words,
+                                            repeat, reset),
+        "parse_date_to_norm": time_per_call(ep.parse_date_to_norm, dated,
+                                            repeat, reset),
+        "parse_time_date_range": time_per_call(ep.parse_time_date_range,
+                                               pairs, repeat, reset),
+        "collapse_expand_tokens": time_stage(
+            ep.make_tokens, lambda toks: ep.collapse_pass(toks, today),
+            tagged, repeat, reset),
+        "parse_phrase": time_stage(
+            collapsed, lambda toks: ep.phrase_pass(toks, now), tagged,
+            repeat, reset),
+        "compute_dates_and_times": time_stage(
+            phrased, lambda d: ep.compute_dates_and_times(d, today), tagged,
+            repeat, reset)}
+    time_per_call(ep.parse_time_value, words, 1)
+    results["memo_hit"] = time_per_call(ep.parse_time_value, words, repeat)
+    return results
+
+
+def bench_stages(phrases: list, repeat: int = 3, tagger: str = None,
+                 now: datetime = reference) -> dict:
+    """Return the mean seconds per phrase spent in each stage of
+    parse_event(), as reported by its timing hook."""
+    import event_parser
+    event_parser.warmup(tagger)
+    times = event_parser.StageTimes()
+    for i in range(repeat):
+        for raw in phrases:
+            event_parser.parse_event(raw, tagger=tagger, now=now,
+                                     timing=times)
+    return {stage: res["mean"] for (stage, res) in times.report().items()}
+
+
+sections = ["startup", "throughput", "stages", "micro"]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark event_parser")
+    parser.add_argument("sections", nargs="*",
+                        help="benchmarks to run, from "
+                        f"{', '.join(sections)} (default: all)")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="fresh interpreters per startup measurement")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="passes over the test data (default: 3)")
+    parser.add_argument("--tagger", help="tagger engine (nltk or lite)")
+    parser.add_argument("--now", type=datetime.fromisoformat,
+                        default=reference,
+                        help="reference time for parsing "
+                        f"(default: {reference.isoformat()})")
+    parser.add_argument("--json", action="store_true",
+                        help="print results as JSON")
+    args = parser.parse_args()
+    for section in args.sections:
+        if section not in sections:
+            parser.error(f"unknown benchmark {section!r}")
+
+    from testdata import testdata
+    phrases = [t[0] for t in testdata]
+    run = args.sections or sections
+
+    results = {"python": platform.python_version(),
+               "tagger": args.tagger or "nltk",
+               "now": args.now.isoformat(),
+               "phrases": len(phrases)}
+    if "startup" in run:
+        results["startup"] = bench_startup(args.runs, args.tagger)
+    if "throughput" in run:
+        results["throughput"] = bench_throughput(phrases, args.repeat,
+                                                 args.tagger, args.now)
+    if "stages" in run:
+        results["stages"] = bench_stages(phrases, args.repeat, args.tagger,
+                                         args.now)
+    if "micro" in run:
+        results["micro"] = bench_micro(phrases, args.repeat, args.tagger,
+                                       args.now)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for section in sections:
+            if section not in results:
+                continue
+            print(f"{section}:")
+            for (name, val) in results[section].items():
+                if name in ("calls", "phrases_per_second"):
+                    print(f"  {name:24} {val:12.1f}")
+                else:
+                    print(f"  {name:24} {val * 1e6:12.1f} us")
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+#
+# event_parser_eval.py: Accuracy and latency evaluation of event_parser.py
+#
+# Copyright (C) 2018 Cardinal Peak LLC
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# A labeled corpus is a JSON lines file, one case per line:
+#
+#   {"text": "Lunch tomorrow at noon",
+#    "expected": {"start_date": "2018-06-16", "end_date": "2018-06-16",
+#                 "start_time": "12:00:00", "end_time": null,
+#                 "title": "Lunch", "location": null},
+#    "now": "2018-06-15T12:00:00"}
+#
+# "expected" is the expected parse, in the form of
+# event_parser.event_to_dict(). "now" is the reference time that the
+# expected parse is relative to; it may be left out, in which case the
+# case is parsed relative to the runner's reference time (--now).
+# Without a corpus, the runner evaluates testdata.py.
+
+import argparse
+import heapq
+import json
+import multiprocessing
+import random
+import sys
+from collections import deque
+from datetime import datetime
+from functools import partial
+from time import perf_counter
+import event_parser
+import event_pool
+from event_parser_bench import percentile, reference
+
+# The scores reported, as by event_parser_test.run(), and the fields
+# that must all be parsed right for a case to count towards each.
+scores = {"date": ("start_date", "end_date"),
+          "time": ("start_time", "end_time"),
+          "title": ("title",),
+          "location": ("location",),
+          "full": event_parser.event_fields}
+
+# The most case latencies kept for the percentiles. Up to this many
+# cases, the percentiles are exact; beyond it, they are those of a
+# uniform random sample of the cases.
+latency_sample = 100000
+
+
+def read_cases(path: str):
+    """Yield the cases of a labeled corpus, in the format described at
+    the top of this file, from path ("-" for stdin), reading it a line
+    at a time."""
+    f = sys.stdin if path == "-" else open(path)
+    try:
+        for (n, line) in enumerate(f, 1):
+            if not line.strip():
+                continue
+            case = json.loads(line)
+            if (not isinstance(case, dict) or
+                    not isinstance(case.get("text"), str) or
+                    not isinstance(case.get("expected"), dict)):
+                raise ValueError(f"{path}:{n}: a case needs \"text\" and "
+                                 "\"expected\"")
+            yield case
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def testdata_cases() -> list:
+    """Return testdata.testdata as corpus cases, relative to the time
+    testdata was imported."""
+    from testdata import testdata, now
+    return [{"text": t[0], "expected": event_parser.event_to_dict(t[1:7]),
+             "now": now.isoformat()}
+            for t in testdata]
+
+
+def eval_case(case: dict, tagger: str = None,
+              now: datetime = reference) -> dict:
+    """Parse one case and compare the result with the expected parse.
+
+    Returns a dict of the case's text and expected parse, the result
+    (None if the parser raised an exception, which is given as error),
+    the names of the fields parsed wrongly, and the seconds the parse
+    took.
+    """
+    if case.get("now"):
+        now = datetime.fromisoformat(case["now"])
+    error = None
+    start = perf_counter()
+    try:
+        res = event_parser.parse_event(case["text"], tagger=tagger, now=now)
+    except Exception as e:
+        res = None
+        error = repr(e)
+    seconds = perf_counter() - start
+    if res is not None:
+        res = event_parser.event_to_dict(res)
+
+    expected = case["expected"]
+    wrong = [field for field in event_parser.event_fields
+             if res is None or res[field] != expected.get(field)]
+    return {"text": case["text"], "expected": expected, "result": res,
+            "error": error, "wrong": wrong, "seconds": seconds}
+
+
+def eval_chunk(chunk: list, tagger: str = None,
+               now: datetime = reference) -> list:
+    """Evaluate a list of (index, case) pairs, returning a list of
+    (index, eval_case() result) pairs."""
+    return [(i, eval_case(case, tagger, now)) for (i, case) in chunk]
+
+
+def evaluate(cases, processes: int = None, chunksize: int = 64,
+             tagger: str = None, now: datetime = reference):
+    """Evaluate an iterable of cases, yielding the eval_case() result
+    for each, in order.
+
+    The cases are sharded, chunksize at a time, across processes worker
+    processes (default: one per CPU), each of which loads the tokenizer
+    and tagger before its first case, so that no case is timed loading
+    them. cases is read only as far as two chunks per worker ahead of
+    the results taken, so it may be a generator over a corpus too large
+    to hold in memory. With processes of 1, the cases are evaluated in
+    this process. Cases without a reference time of their own are
+    parsed relative to now.
+    """
+    if processes == 1:
+        event_parser.warmup(tagger)
+        for case in cases:
+            yield eval_case(case, tagger, now)
+        return
+
+    processes = processes or multiprocessing.cpu_count()
+    func = partial(eval_chunk, tagger=tagger, now=now)
+    with multiprocessing.Pool(processes, initializer=event_pool.init_worker,
+                              initargs=(tagger,)) as pool:
+        pending = deque()
+        for chunk in event_pool.chunked(cases, chunksize):
+            pending.append(pool.apply_async(func, (chunk,)))
+            if len(pending) >= 2 * processes:
+                yield from (res for (i, res) in pending.popleft().get())
+        while pending:
+            yield from (res for (i, res) in pending.popleft().get())
+
+
+class EvalReport():
+    """Totals eval_case() results, as they arrive, into a report (see
+    make_report()), keeping only counts, the slowest cases, the first
+    max_failures failed cases and a sample of latencies (see
+    latency_sample), so that its memory use does not grow with the
+    corpus.
+    """
+
+    def __init__(self, slowest: int = 10, max_failures: int = 100):
+        self.slowest = slowest
+        self.max_failures = max_failures
+        self.cases = 0
+        self.errors = 0
+        self.correct = dict.fromkeys(scores, 0)
+        self.fields = dict.fromkeys(event_parser.event_fields, 0)
+        self.total = 0.0
+        self.max = 0.0
+        self.latencies = []
+        self.rng = random.Random(0)
+        # (seconds, case number, text) of the slowest cases, as a heap
+        self.slow = []
+        self.failures = []
+
+    def add(self, res: dict) -> None:
+        """Count one eval_case() result."""
+        self.cases += 1
+        self.errors += res["error"] is not None
+        wrong = set(res["wrong"])
+        for (name, fields) in scores.items():
+            self.correct[name] += not wrong.intersection(fields)
+        for field in self.fields:
+            self.fields[field] += field not in wrong
+        if wrong and len(self.failures) < self.max_failures:
+            self.failures.append(res)
+
+        seconds = res["seconds"]
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if len(self.latencies) < latency_sample:
+            self.latencies.append(seconds)
+        else:
+            i = self.rng.randrange(self.cases)
+            if i < latency_sample:
+                self.latencies[i] = seconds
+        entry = (seconds, self.cases, res["text"])
+        if len(self.slow) < self.slowest:
+            heapq.heappush(self.slow, entry)
+        elif self.slow and entry > self.slow[0]:
+            heapq.heapreplace(self.slow, entry)
+
+    def report(self) -> dict:
+        """Return the report of the results counted so far."""
+        n = max(self.cases, 1)
+        times = sorted(self.latencies)
+        return {
+            "cases": self.cases, "errors": self.errors,
+            "scores": {name: {"correct": correct, "accuracy": correct / n}
+                       for (name, correct) in self.correct.items()},
+            "fields": {field: correct / n
+                       for (field, correct) in self.fields.items()},
+            "latency": {
+                "total": self.total, "mean": self.total / n,
+                "p50": percentile(times, 50) if times else 0.0,
+                "p90": percentile(times, 90) if times else 0.0,
+                "p99": percentile(times, 99) if times else 0.0,
+                "max": self.max},
+            "slowest": [{"text": text, "seconds": seconds}
+                        for (seconds, i, text) in sorted(self.slow,
+                                                         reverse=True)],
+            "failures": list(self.failures)}
+
+
+def make_report(results, slowest: int = 10, max_failures: int = 100) -> dict:
+    """Summarize an iterable of eval_case() results, such as evaluate()
+    yields, taking them one at a time.
+
+    Returns a dict with:
+
+    cases, errors
+        the numbers of cases, and of cases the parser raised on
+    scores
+        for each of scores, the number of cases correct and the
+        fraction of all cases
+    fields
+        for each of event_parser.event_fields, the fraction of cases
+        that parsed it right
+    latency
+        the total, mean, 50th, 90th and 99th percentile (see
+        latency_sample) and maximum seconds per case
+    slowest
+        the text and seconds of the slowest cases, slowest first
+    failures
+        the first max_failures cases with any field wrong
+    """
+    report = EvalReport(slowest, max_failures)
+    for res in results:
+        report.add(res)
+    return report.report()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Evaluate event_parser's accuracy and latency on a "
+        "labeled corpus")
+    parser.add_argument("corpus", nargs="*",
+                        help="JSON lines corpus files, or - for stdin "
+                        "(default: testdata.py)")
+    parser.add_argument("--processes", type=int,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("--chunksize", type=int, default=64,
+                        help="cases sent to a worker at a time "
+                        "(default: 64)")
+    parser.add_argument("--tagger", help="tagger engine (nltk or lite)")
+    parser.add_argument("--now", type=datetime.fromisoformat,
+                        default=reference,
+                        help="reference time for cases without their own "
+                        f"(default: {reference.isoformat()})")
+    parser.add_argument("--slowest", type=int, default=10,
+                        help="slowest cases to report (default: 10)")
+    parser.add_argument("--max-failures", type=int, default=100,
+                        help="failed cases to include in the report "
+                        "(default: 100)")
+    parser.add_argument("--report", metavar="FILE",
+                        help="write the full report here, as JSON")
+    args = parser.parse_args()
+    if args.chunksize < 1:
+        parser.error("--chunksize must be at least 1")
+
+    if args.corpus:
+        cases = (case for path in args.corpus for case in read_cases(path))
+    else:
+        cases = testdata_cases()
+
+    start = perf_counter()
+    report = make_report(evaluate(cases, args.processes, args.chunksize,
+                                  args.tagger, args.now),
+                         args.slowest, args.max_failures)
+    wall = perf_counter() - start
+    report.update({"corpus": args.corpus or ["testdata.py"],
+                   "tagger": args.tagger or event_parser.tagger_engine,
+                   "now": args.now.isoformat(),
+                   "processes": args.processes or multiprocessing.cpu_count(),
+                   "wall_seconds": wall})
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+    correct = {name: res["correct"] for (name, res) in
+               report["scores"].items()}
+    print(f"Correctly parsed date: {correct['date']} "
+          f"time: {correct['time']} title: {correct['title']} "
+          f"loc: {correct['location']} full: {correct['full']} "
+          f"of {report['cases']} ({report['errors']} errors)")
+    print("fields: " + ", ".join(f"{field} {acc:.1%}" for (field, acc)
+                                 in report["fields"].items()))
+    latency = report["latency"]
+    print(f"latency: mean {latency['mean'] * 1e6:.0f} us, "
+          f"p50 {latency['p50'] * 1e6:.0f} us, "
+          f"p90 {latency['p90'] * 1e6:.0f} us, "
+          f"p99 {latency['p99'] * 1e6:.0f} us, "
+          f"max {latency['max'] * 1e6:.0f} us; {wall:.1f} s wall")
+    if report["slowest"]:
+        print("slowest:")
+        for res in report["slowest"]:
+            print(f"  {res['seconds'] * 1e6:10.0f} us  {res['text']}")
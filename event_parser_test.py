@@ -18,13 +18,40 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
+import asyncio
+import gc
+import http.client
+import io
+import json
+import os
+import re
+import signal
+import tempfile
+import threading
+import types
+import weakref
+from datetime import date, time, datetime
+from nltk.tag.perceptron import PerceptronTagger
 import event_parser as ep
+import taggers
+from parse_cache import ParseCache
+from event_async import AsyncParser, parse_events_async
+from event_incremental import IncrementalParser
+from event_pool import ParserPool, chunked
+import event_parser_eval
+import event_server
+import testdata_gen
+from query_log import QueryLogger
+from norm_values import TimeValue, DateValue, ABS, REL, WEEKDAY, MONTHDAY
 from testdata import testdata
 
 
 def test_parse_time_to_norm(raw: str, expect: str):
     res = ep.parse_time_to_norm(raw)
     assert res == expect, (raw, res)
+    if expect:
+        # the normal form parses back to the same value
+        assert ep.parse_time_value(expect) == ep.parse_time_value(raw), raw
 
 
 # list of (input, expected output)
@@ -74,6 +101,9 @@ time_strings = [("8", "reltime:08:00:00"),
                 ("midnight", "abstime:00:00:00"),
                 ("noon", "abstime:12:00:00"),
                 ("000", None),
+                ("abstime:13:10:00", "abstime:13:10:00"),
+                ("reltime:01:23:00", "reltime:01:23:00"),
+                ("relax", None),
 
                 ("1o'clock", "reltime:01:00:00"),
                 ("1oclock", "reltime:01:00:00"),
@@ -102,6 +132,9 @@ for v in time_strings:
 def test_parse_date_to_norm(raw: str, expect: str):
     res = ep.parse_date_to_norm(raw)
     assert res == expect, raw
+    if expect:
+        # the normal form parses back to the same value
+        assert ep.parse_date_value(expect) == ep.parse_date_value(raw), raw
 
 
 # list of (input, expected output)
@@ -156,6 +189,23 @@ date_strings = [("2014/5/3", "absdate:05/03/2014"),
 for v in date_strings:
     test_parse_date_to_norm(*v)
 
+assert ep.parse_time_value("8p") == TimeValue(True, 20)
+assert ep.parse_time_value("8:15") == TimeValue(False, 8, 15)
+assert ep.parse_date_value("3/6") == DateValue(REL, month=3, day=6)
+assert ep.parse_date_value("thur") == DateValue(WEEKDAY, weekday=3)
+assert ep.parse_date_value("reldate:monthday:21") == DateValue(MONTHDAY,
+                                                               day=21)
+assert ep.parse_monthday_value("21") == DateValue(MONTHDAY, day=21)
+assert ep.parse_monthday_value("32") is None
+
+# the lite tagger gets right the tags that the parser's rules look at
+lite_words = ["Dinner", "at", "Bob", "'s", "on", "May", "5", ",", "we",
+              "may", "go", "to", "the", "big", "hall", "next", "week"]
+lite_tags = ["NN", "IN", "NNP", "POS", "IN", "NNP", "CD", ",", "PRP",
+             "MD", "VB", "TO", "DT", "JJ", "NN", "JJ", "NN"]
+assert ([tag for (w, tag) in taggers.get_tagger("lite").tag(lite_words)] ==
+        lite_tags)
+
 
 def test_parse(input_tuple) -> bool:
     """Test parse the input tuple, return results.
@@ -216,3 +266,323 @@ def run():
 
 
 run()
+
+# no pattern is compiled while parsing: once the tokenizer has compiled
+# its patterns, on the first run, parsing the corpus again leaves the re
+# module's cache empty
+ep.clear_memos()
+re.purge()
+ep.parse_events([t[0] for t in testdata])
+compiled = list(re._cache) + list(getattr(re, "_cache2", ()))
+assert not compiled, f"patterns compiled at runtime: {compiled}"
+
+# the batch API gives the same results as parsing one phrase at a time
+phrases = [t[0] for t in testdata[:20]]
+assert ep.parse_events(phrases) == [ep.parse_event(p) for p in phrases]
+
+# cached results are the same as uncached ones
+cache = ParseCache(maxsize=10)
+for p in phrases + phrases[:5]:
+    assert cache.parse_event("  " + p) == ep.parse_event(p), p
+stats = cache.stats()
+assert (stats["hits"], stats["misses"], stats["evictions"]) == (0, 25, 15)
+for p in phrases[-5:]:
+    cache.parse_event(p)
+assert cache.stats()["hits"] == 5
+
+# relative dates follow the reference time given to parse_event()
+ref = datetime(2020, 2, 28, 9, 30)
+assert ep.parse_event("Dentist tomorrow at 10am", now=ref)[:3] == (
+    date(2020, 2, 29), date(2020, 2, 29), time(10))
+assert ep.parse_event("Call Sam in 2 hours", now=lambda: ref)[:3] == (
+    date(2020, 2, 28), date(2020, 2, 28), time(11, 30))
+assert ep.parse_date_value("yesterday", date(2020, 3, 1)) == DateValue(
+    ABS, 2020, 2, 29)
+
+# the asyncio API gives the same results, without blocking the loop
+assert (asyncio.run(parse_events_async(phrases, now=ref)) ==
+        ep.parse_events(phrases, now=ref))
+
+# a capped AsyncParser can be used from one event loop after another
+capped = AsyncParser(max_concurrency=1, tagger="lite")
+for i in range(2):
+    assert asyncio.run(capped.parse_events(phrases, now=ref, chunksize=1)) \
+        == ep.parse_events(phrases, tagger="lite", now=ref)
+
+assert ep.event_to_dict((date(2020, 2, 29), None, time(10), None, "Dentist",
+                         None)) == {
+    "start_date": "2020-02-29", "end_date": None, "start_time": "10:00:00",
+    "end_time": None, "title": "Dentist", "location": None}
+
+# logged phrases are buffered, and written by flush()
+with tempfile.TemporaryDirectory() as tmp:
+    ep.query_logger = QueryLogger(os.path.join(tmp, "queries.log"))
+    ep.parse_event("Lunch at noon", log=True)
+    assert ep.query_logger.flush(5)
+    with open(os.path.join(tmp, "queries.log")) as f:
+        assert f.read() == "Lunch at noon\n"
+    ep.query_logger.close()
+    ep.query_logger = None
+
+# a forked child's logger writes only the child's own lines
+if hasattr(os, "fork"):
+    with tempfile.TemporaryDirectory() as tmp:
+        logger = QueryLogger(os.path.join(tmp, "queries.log"),
+                             flush_interval=60)
+        logger.log("parent")
+        pid = os.fork()
+        if pid == 0:
+            logger.log("child")
+            logger.close()
+            os._exit(0)
+        os.waitpid(pid, 0)
+        logger.close()
+        with open(os.path.join(tmp, "queries.log")) as f:
+            assert sorted(f) == ["child\n", "parent\n"]
+
+# a logger that is no longer used, once idle, is not kept alive
+with tempfile.TemporaryDirectory() as tmp:
+    logger = QueryLogger(os.path.join(tmp, "queries.log"),
+                         flush_interval=0.01)
+    logger.log("Lunch at noon")
+    assert logger.flush(5)
+    (writer, logger) = (logger.thread, weakref.ref(logger))
+    writer.join(5)
+    gc.collect()
+    assert logger() is None, "idle logger kept alive"
+
+# the timing hook hears about every stage of a parse
+times = ep.StageTimes()
+ep.parse_event("Lunch tomorrow at noon", timing=times)
+assert all(calls == 1 for calls in times.calls.values()), times.calls
+
+# rule stats count attempts and fires, only while enabled
+ep.reset_rule_stats()
+ep.enable_rule_stats()
+ep.parse_event("Lunch at noon")
+ep.enable_rule_stats(False)
+ep.parse_event("Lunch at noon")
+stats = ep.rule_stats()
+assert stats["phrase"]["at_time"]["fires"] == 1, stats
+assert stats["collapse"]["ignored"]["attempts"] == 3, stats
+
+# only the rules that can start on a token are tried there
+assert [rule.name for rule in ep.rules_for(("at", "IN"), ep.phrase_rules,
+                                           ep.phrase_dispatch)] == [
+    "location", "at_cd_cd", "at_time"]
+assert [rule.name for rule in ep.rules_for((None, "NN"), ep.collapse_rules,
+                                           ep.collapse_dispatch)] == [
+    "ignored"]
+
+# the value parsers are memoized, keyed on the reference date
+ep.clear_memos()
+assert ep.parse_date_value("tomorrow", date(2020, 2, 28)) == \
+    DateValue(ABS, 2020, 2, 29)
+assert ep.parse_date_value("tomorrow", date(2020, 2, 29)) == \
+    DateValue(ABS, 2020, 3, 1)
+ep.parse_time_value("noon")
+ep.parse_time_value("noon")
+assert ep.memo_stats()["parse_time_value"]["hits"] == 1, ep.memo_stats()
+assert ep.memo_stats()["date_value"]["misses"] == 2, ep.memo_stats()
+
+# threads parsing relative to different dates each get their own
+# date's day table
+wrong = []
+
+
+def check_day_table(day):
+    for i in range(2000):
+        if ep.day_table(day)["today"] != DateValue.from_date(day):
+            wrong.append(day)
+
+
+workers = [threading.Thread(target=check_day_table, args=(date(2020, 1, d),))
+           for d in (1, 2, 3, 4)]
+for w in workers:
+    w.start()
+for w in workers:
+    w.join()
+assert not wrong, wrong
+
+# the window cache tags exactly as the tagger it wraps
+cache = taggers.WindowCache(taggers.LiteTagger())
+words = ep.word_tokenize("Lunch with May at noon on Friday")
+assert cache.tag(words) == taggers.LiteTagger().tag(words)
+assert cache.tag(words) == taggers.LiteTagger().tag(words)
+assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1, \
+    cache.stats()
+
+
+# and sends the tagger only the words from the first unseen window on
+class StartsTagger(taggers.LiteTagger):
+    def iter_tags(self, words, start=0, tags=()):
+        starts.append(start)
+        return super().iter_tags(words, start, tags)
+
+
+starts = []
+cache = taggers.WindowCache(StartsTagger())
+cache.tag(words)
+other = words[:-1] + ["Monday"]
+assert cache.tag(other) == taggers.LiteTagger().tag(other)
+assert starts == [0, len(words) - 1 - taggers.context_words], starts
+
+# an incremental parser gives the same results as parse_event() as a
+# phrase is typed, and an edit at the end reruns only the end
+inc = IncrementalParser("lite")
+phrase = "Lunch with Kate at the Corner Cafe on Friday at noon"
+for i in range(1, len(phrase) + 1):
+    assert inc.parse(phrase[:i], now=ref) == ep.parse_event(
+        phrase[:i], tagger="lite", now=ref), phrase[:i]
+inc.parse(phrase + " for 30 minutes", now=ref)
+assert inc.work["collapse"] <= 4, inc.work
+
+# the perceptron's tag dictionary coverage, counted per word and per
+# phrase
+model = types.SimpleNamespace(tagdict={"at": "IN", "noon": "NN"})
+assert taggers.tagdict_coverage([("at noon",), ("Lunch at noon",)],
+                                model) == {"words": 0.8, "sentences": 0.5}
+
+# the lexicon fast path gives exactly the perceptron's tags, whether it
+# tags a sentence from the lexicon alone or asks the model for some words
+sents = [ep.word_tokenize(t[0]) for t in testdata] + [["at", "the"]]
+model = PerceptronTagger(load=False)
+model.train([taggers.LiteTagger().tag(words) for words in sents], nr_iter=1)
+fast = taggers.LexiconTagger(model)
+assert [fast.tag(words) for words in sents] == \
+    [model.tag(words) for words in sents]
+stats = fast.stats()
+assert stats["hits"] and stats["misses"] and stats["lexicon_sentences"], \
+    stats
+report = taggers.parity_report(engine="nltk", reference="perceptron")
+assert report["tag_agreement"] == 1.0, report
+
+# the evaluation runner scores a labeled case field by field
+case = {"text": "Lunch at noon",
+        "expected": ep.event_to_dict(ep.parse_event("Lunch at noon",
+                                                    tagger="lite", now=ref)),
+        "now": ref.isoformat()}
+case["expected"]["location"] = "Cafe"
+report = event_parser_eval.make_report(
+    event_parser_eval.evaluate([case], processes=1, tagger="lite"))
+assert report["fields"]["title"] == 1.0 and \
+    report["fields"]["location"] == 0.0, report["fields"]
+assert report["scores"]["full"]["correct"] == 0, report["scores"]
+
+# generated cases are reproducible, and parse as expected
+cases = list(testdata_gen.generate(20, seed=1))
+assert cases == list(testdata_gen.generate(20, seed=1))
+report = event_parser_eval.make_report(
+    event_parser_eval.evaluate(cases, processes=1, tagger="lite"))
+assert report["scores"]["full"]["correct"] == 20, report["failures"]
+
+# the report keeps only the slowest cases and the first failures asked for
+results = [{"text": str(i), "error": None, "wrong": ["title"] * (i % 2),
+            "seconds": i / 1000} for i in range(50)]
+report = event_parser_eval.make_report(iter(results), slowest=3,
+                                       max_failures=2)
+assert [res["text"] for res in report["slowest"]] == ["49", "48", "47"], \
+    report["slowest"]
+assert [res["text"] for res in report["failures"]] == ["1", "3"], \
+    report["failures"]
+assert report["scores"]["title"]["correct"] == 25, report["scores"]
+
+# a parser pool gives the same results as parse_events(), in order or
+# not, and reads no further ahead of its results than it must
+phrases = [t[0] for t in testdata[:40]]
+expected = ep.parse_events(phrases, tagger="lite")
+read = []
+
+
+def reading(items):
+    for item in items:
+        read.append(item)
+        yield item
+
+
+with ParserPool(processes=2, chunksize=4, tagger="lite") as pool:
+    results = pool.parse(reading(phrases))
+    next(results)
+    assert len(read) <= (pool.max_pending + 1) * 4, len(read)
+    assert [expected[0]] + list(results) == expected
+    unordered = dict(pool.parse(phrases, ordered=False))
+    assert [unordered[i] for i in range(len(phrases))] == expected
+
+# an empty chunk would drop every phrase, so it is refused
+try:
+    list(chunked(phrases, 0))
+    assert False, "chunksize 0 accepted"
+except ValueError:
+    pass
+
+
+# a stream of phrases gives one JSON object per line, in order, with an
+# error for a phrase that does not parse, and output is flushed while
+# waiting for more input
+class FlushedOutput(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.flushed = threading.Event()
+
+    def flush(self):
+        self.flushed.set()
+
+
+out = FlushedOutput()
+
+
+def slow_lines():
+    yield "Lunch at noon\n"
+    yield "Dentist on 2/30\n"
+    yield "Standup at 9:30am tomorrow\n" if out.flushed.wait(5) else "late\n"
+
+
+assert ep.parse_stream(slow_lines(), out, flush_interval=0, tagger="lite",
+                       now=ref) == 3
+lines = [json.loads(line) for line in out.getvalue().splitlines()]
+assert [obj["text"] for obj in lines] == [
+    "Lunch at noon", "Dentist on 2/30", "Standup at 9:30am tomorrow"]
+assert lines[0] == {"text": "Lunch at noon",
+                    **ep.event_to_dict(ep.parse_event(
+                        "Lunch at noon", tagger="lite", now=ref))}
+assert set(lines[0]) == {"text", *ep.event_fields}
+assert set(lines[1]) == {"text", "error"}, lines[1]
+
+# a chunk must hold at least one phrase, or the stream never moves
+try:
+    ep.parse_stream(["Lunch at noon\n"], io.StringIO(), chunksize=0)
+    assert False, "chunksize 0 accepted"
+except ValueError:
+    pass
+
+# the server answers on an ephemeral port, and rejects a negative
+# Content-Length rather than waiting for the body
+if hasattr(os, "fork"):
+    server = event_server.make_server(port=0, tagger="lite")
+    pid = os.fork()
+    if pid == 0:
+        try:
+            event_server.serve(server, workers=1)
+        finally:
+            os._exit(0)
+    try:
+        conn = http.client.HTTPConnection(*server.server_address, timeout=10)
+        conn.request("GET", "/health")
+        resp = conn.getresponse()
+        assert resp.status == 200 and json.load(resp) == {"status": "ok"}
+        conn.request("POST", "/parse", json.dumps({"text": "Lunch at noon",
+                                                   "now": ref.isoformat()}))
+        resp = conn.getresponse()
+        assert resp.status == 200 and json.load(resp) == ep.event_to_dict(
+            ep.parse_event("Lunch at noon", tagger="lite", now=ref))
+        conn.putrequest("POST", "/parse")
+        conn.putheader("Content-Length", "-1")
+        conn.endheaders()
+        resp = conn.getresponse()
+        assert resp.status == 400, resp.status
+        resp.read()
+        conn.close()
+    finally:
+        server.server_close()
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
@@ -0,0 +1,154 @@
+# event_pool.py: Parse calendar event phrases in parallel worker processes
+#
+# Copyright (C) 2018 Cardinal Peak LLC
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import multiprocessing
+import queue
+from collections import deque
+from functools import partial
+from itertools import islice
+import event_parser
+
+
+def init_worker(tagger: str = None) -> None:
+    """Pool initializer: load the tokenizer and tagger models, so that
+    the worker's first real chunk does not pay for them.
+    """
+    event_parser.warmup(tagger)
+
+
+def parse_chunk(chunk: list, tagger: str = None) -> list:
+    """Parse a list of (index, phrase) pairs, in one batch, and return
+    a list of (index, result) pairs.
+    """
+    results = event_parser.parse_events([raw for (i, raw) in chunk],
+                                        tagger=tagger)
+    return [(i, res) for ((i, raw), res) in zip(chunk, results)]
+
+
+def chunked(iterable, size: int):
+    """Yield successive lists of (index, item) pairs of length size
+    (the last may be shorter) from iterable. size must be at least 1.
+    """
+    if size < 1:
+        raise ValueError("chunksize must be >= 1")
+    it = enumerate(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def finished(done: queue.SimpleQueue) -> list:
+    """Wait for the next chunk's results on done and return them, or
+    raise the exception its worker raised."""
+    results = done.get()
+    if isinstance(results, BaseException):
+        raise results
+    return results
+
+
+class ParserPool():
+    """A pool of worker processes, each with its own loaded tagger, for
+    parsing large numbers of phrases.
+
+    processes is the number of workers (default: one per CPU), and
+    chunksize is the number of phrases sent to a worker at a time;
+    each chunk is tagged with a single call to the tagger. tagger
+    names the tagger engine, as for event_parser.parse_event(). No
+    more than max_pending chunks (default: two per worker) are sent to
+    the workers ahead of the results taken from parse().
+
+    Use as a context manager, or call close() when done:
+
+        with ParserPool() as pool:
+            for res in pool.parse(phrases):
+                ...
+    """
+
+    def __init__(self, processes: int = None, chunksize: int = 256,
+                 tagger: str = None, max_pending: int = None):
+        if chunksize < 1:
+            raise ValueError("chunksize must be >= 1")
+        self.chunksize = chunksize
+        self.max_pending = max_pending or 2 * (processes or
+                                               multiprocessing.cpu_count())
+        self.parse_chunk = partial(parse_chunk, tagger=tagger)
+        self.pool = multiprocessing.Pool(processes, initializer=init_worker,
+                                         initargs=(tagger,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        self.pool.terminate()
+        self.pool.join()
+
+    def parse(self, phrases, ordered: bool = True, chunksize: int = None):
+        """Parse an iterable of phrases, yielding results as they arrive.
+
+        If ordered is True (the default), yields the parse_event()
+        result tuple for each phrase, in input order. If ordered is
+        False, yields (index, result) pairs in whatever order the
+        workers finish them, where index is the position of the phrase
+        in the input.
+
+        phrases is read a chunk at a time, and only as far as
+        max_pending chunks ahead of the results taken, so it may be a
+        generator over a very large input. An exception raised while
+        parsing is re-raised here, as it would be by parse_events().
+        """
+        chunks = chunked(phrases, chunksize or self.chunksize)
+        if ordered:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(self.pool.apply_async(self.parse_chunk,
+                                                     (chunk,)))
+                if len(pending) >= self.max_pending:
+                    yield from (res for (i, res) in pending.popleft().get())
+            while pending:
+                yield from (res for (i, res) in pending.popleft().get())
+        else:
+            # each chunk's results, or its exception, as it finishes
+            done = queue.SimpleQueue()
+            pending = 0
+            for chunk in chunks:
+                self.pool.apply_async(self.parse_chunk, (chunk,),
+                                      callback=done.put,
+                                      error_callback=done.put)
+                pending += 1
+                if pending >= self.max_pending:
+                    yield from finished(done)
+                    pending -= 1
+            for i in range(pending):
+                yield from finished(done)
+
+
+def parse_events_parallel(phrases, processes: int = None,
+                          chunksize: int = 256, ordered: bool = True,
+                          tagger: str = None):
+    """Parse an iterable of phrases using a temporary ParserPool.
+
+    Yields results as for ParserPool.parse(). The pool is shut down
+    when the generator finishes or is closed.
+    """
+    with ParserPool(processes, chunksize, tagger) as pool:
+        yield from pool.parse(phrases, ordered)
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+#
+# event_server.py: An HTTP/JSON service for event_parser.py
+#
+# Copyright (C) 2018 Cardinal Peak LLC
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Endpoints, all returning JSON:
+#
+#   GET  /parse?text=...[&now=...]
+#   POST /parse            {"text": "..."} or {"texts": ["...", ...]},
+#                          optionally with "now"
+#        The parse as a dict of event_parser.event_fields (see
+#        event_parser.event_to_dict()), or for "texts" {"results": [...]}
+#
+#   GET  /google_calendar?text=...[&now=...][&duration=...]
+#   POST /google_calendar  {"text": "...", "now": ..., "duration": ...}
+#        {"url": "..."}, as from google_calendar.parse_to_google_calendar()
+#
+#   GET  /health           {"status": "ok"}
+#
+# "now" is an ISO 8601 date or date and time to parse relative to; the
+# default is the server's clock. Errors are returned as {"error": "..."}
+# with a 4xx or 5xx status.
+
+import argparse
+import json
+import os
+import signal
+import socketserver
+import sys
+import time
+import traceback
+import urllib.parse
+from datetime import datetime
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import event_parser
+import google_calendar
+import query_log
+
+# largest request body accepted, in bytes
+max_body = 1 << 20
+
+# seconds a connection may sit idle, or a request body take to arrive,
+# before the worker gives up on it
+request_timeout = 30
+
+# A worker that dies within worker_min_life seconds of starting is
+# replaced only after a delay, doubling from respawn_delay up to
+# max_respawn_delay while workers keep dying young.
+worker_min_life = 1.0
+respawn_delay = 0.1
+max_respawn_delay = 10.0
+
+
+class RequestError(Exception):
+    """A bad request, to be answered with status and a message"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class EventRequestHandler(BaseHTTPRequestHandler):
+    """Answers the requests described at the top of this file. The
+    server's tagger and log attributes are passed to the parser."""
+
+    server_version = "EventParser/1.0"
+    timeout = request_timeout
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        self.handle_request(url.path, params)
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        try:
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+            except ValueError:
+                length = -1
+            if length < 0:
+                raise RequestError(400, "bad Content-Length")
+            if length > max_body:
+                raise RequestError(413, "request body too large")
+            params = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(params, dict):
+                raise RequestError(400, "request body must be a JSON object")
+        except RequestError as e:
+            self.send_json(e.status, {"error": str(e)})
+            return
+        except ValueError:
+            self.send_json(400, {"error": "request body is not valid JSON"})
+            return
+        except TimeoutError:
+            self.log_error("request body timed out")
+            self.close_connection = True
+            return
+        self.handle_request(url.path, params)
+
+    def handle_request(self, path: str, params: dict) -> None:
+        """Answer a request for path, with the parameters params."""
+        try:
+            if path == "/health":
+                res = {"status": "ok"}
+            elif path == "/parse":
+                res = self.parse(params)
+            elif path == "/google_calendar":
+                res = self.google_calendar(params)
+            else:
+                raise RequestError(404, f"no such endpoint {path}")
+        except RequestError as e:
+            self.send_json(e.status, {"error": str(e)})
+            return
+        except Exception as e:
+            self.log_error("parsing %r: %r", params, e)
+            self.send_json(500, {"error": "internal error"})
+            return
+        self.send_json(200, res)
+
+    def parse(self, params: dict) -> dict:
+        now = reference_time(params)
+        if "texts" in params:
+            texts = params["texts"]
+            if (not isinstance(texts, list) or
+                    not all(isinstance(t, str) for t in texts)):
+                raise RequestError(400, "texts must be a list of strings")
+            results = event_parser.parse_events(
+                texts, log=self.server.log, tagger=self.server.tagger,
+                now=now)
+            return {"results": [event_parser.event_to_dict(res)
+                                for res in results]}
+        res = event_parser.parse_event(text_param(params), log=self.server.log,
+                                       tagger=self.server.tagger, now=now)
+        return event_parser.event_to_dict(res)
+
+    def google_calendar(self, params: dict) -> dict:
+        try:
+            duration = int(params.get("duration", 30))
+        except ValueError:
+            raise RequestError(400, "duration must be a number of minutes")
+        url = google_calendar.parse_to_google_calendar(
+            text_param(params), duration, log=self.server.log,
+            now=reference_time(params), tagger=self.server.tagger)
+        return {"url": url}
+
+    def send_json(self, status: int, obj) -> None:
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self) -> str:
+        # unix socket clients have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+
+def text_param(params: dict) -> str:
+    """Return the "text" parameter, which must be a string."""
+    text = params.get("text")
+    if not isinstance(text, str):
+        raise RequestError(400, "text must be given as a string")
+    return text
+
+
+def reference_time(params: dict):
+    """Return the "now" parameter as a datetime, or None if absent."""
+    if params.get("now") is None:
+        return None
+    try:
+        return datetime.fromisoformat(params["now"])
+    except (TypeError, ValueError):
+        raise RequestError(400, "now must be an ISO 8601 date or datetime")
+
+
+class UnixHTTPServer(socketserver.UnixStreamServer):
+    """An HTTP server listening on a unix domain socket"""
+
+    def server_bind(self):
+        # remove a socket file left behind by an earlier server
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        super().server_bind()
+
+
+def make_server(port: int = 8080, unix_socket: str = None,
+                host: str = "127.0.0.1", tagger: str = None,
+                log: bool = False):
+    """Return a server, bound and listening but not yet serving, on
+    the unix domain socket path unix_socket if given, or else on
+    host:port. tagger is the tagger engine to parse with, and log says
+    whether to log the phrases parsed (see parse_event())."""
+    if unix_socket:
+        server = UnixHTTPServer(unix_socket, EventRequestHandler)
+    else:
+        server = HTTPServer((host, port), EventRequestHandler)
+    server.tagger = tagger
+    server.log = log
+    return server
+
+
+def serve(server, workers: int = None) -> None:
+    """Serve requests on server from workers (default: one per CPU)
+    pre-forked worker processes, until interrupted or terminated.
+
+    The tokenizer and tagger are loaded once, before forking, so every
+    worker starts warm and no request pays for loading them. The
+    workers share the listening socket, and each handles one request
+    at a time. A worker that dies is replaced, after a delay if it
+    died young (see worker_min_life). A worker that is terminated
+    writes out its logged phrases before it exits.
+    """
+    event_parser.warmup(server.tagger)
+    workers = workers or os.cpu_count() or 1
+    children = {}
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            # In the worker: leave shutdown to the parent, which sends
+            # SIGTERM, handled by stop() as inherited. os._exit() skips
+            # the atexit handlers, so the logs are closed here.
+            status = 0
+            try:
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                server.serve_forever()
+            except SystemExit:
+                pass
+            except Exception:
+                traceback.print_exc()
+                status = 1
+            finally:
+                signal.signal(signal.SIGTERM, signal.SIG_IGN)
+                query_log.close_loggers()
+                os._exit(status)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for i in range(workers):
+            spawn()
+        delay = 0.0
+        while True:
+            (pid, status) = os.wait()
+            started = children.pop(pid, None)
+            if started is not None and (time.monotonic() - started <
+                                        worker_min_life):
+                delay = min(max(2 * delay, respawn_delay), max_respawn_delay)
+                print(f"worker {pid} died at once; respawning in "
+                      f"{delay:.1f} s", file=sys.stderr)
+                time.sleep(delay)
+            else:
+                delay = 0.0
+            spawn()
+    finally:
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+        for pid in children:
+            os.waitpid(pid, 0)
+        server.server_close()
+        if isinstance(server, UnixHTTPServer):
+            os.unlink(server.server_address)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Serve event_parser results as JSON over HTTP")
+    parser.add_argument("--port", type=int, default=8080,
+                        help="TCP port to listen on (default: 8080)")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--unix", metavar="PATH",
+                        help="listen on this unix domain socket instead")
+    parser.add_argument("--workers", type=int,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("--tagger", help="tagger engine (nltk or lite)")
+    parser.add_argument("--log", action="store_true",
+                        help="log the phrases parsed")
+    parser.add_argument("--log-file", metavar="PATH",
+                        help="log the phrases parsed to this file "
+                        "(implies --log)")
+    args = parser.parse_args()
+
+    if args.log_file:
+        event_parser.logfile = args.log_file
+    server = make_server(args.port, args.unix, args.host, args.tagger,
+                         args.log or bool(args.log_file))
+    where = args.unix or f"http://{args.host}:{args.port}/"
+    print(f"serving on {where}", file=sys.stderr)
+    try:
+        serve(server, args.workers)
+    except KeyboardInterrupt:
+        pass
@@ -53,7 +53,10 @@ def convert_date_time(d: date, t: time) -> str:
 
 def parse_to_google_calendar(raw: str,
                              default_duration: int = 30,
-                             debug: bool = False):
+                             debug: bool = False,
+                             log: bool = True,
+                             now=None,
+                             tagger: str = None):
 
     """Parse a natural language string to a Google calendar event URL.
 
@@ -68,14 +71,18 @@ def parse_to_google_calendar(raw: str,
     only a start time (and not end time) can be determined from the
     input.
 
+    log, now and tagger are as for parse_event(); the phrase is logged
+    by default.
+
     """
 
-    ret = event_parser.parse_event(raw, debug, log=True)
+    now = event_parser.reference_time(now)
+    ret = event_parser.parse_event(raw, debug, log, tagger, now)
     (st_date, end_date, st_time, end_time, title, loc) = ret
 
     if st_date is None:
-        st_date = event_parser.today
-        end_date = event_parser.today
+        st_date = now.date()
+        end_date = now.date()
 
     if st_time is not None and end_time is None:
         st_dt = datetime.combine(st_date, st_time)
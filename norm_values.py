@@ -0,0 +1,115 @@
+# norm_values.py: Typed normalized time and date values
+#
+# Copyright (C) 2018 Cardinal Peak LLC
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from datetime import date
+
+# kinds of DateValue
+ABS = "abs"
+REL = "rel"
+WEEKDAY = "weekday"
+MONTHDAY = "monthday"
+
+
+class TimeValue():
+    """A normalized time of day, as carried in EToken.time.
+
+    .absolute
+        True if we know the am/pm for certain, in which case .hour is
+        in the range 0-23. False if we cannot determine the am/pm, in
+        which case .hour is in the range 1-12.
+    .hour, .minute, .second
+        ints
+
+    Values are shared between tokens, so treat them as immutable.
+    str() gives the old string normal form, "abstime:hh:mm:ss" or
+    "reltime:hh:mm:ss", which is only meant for debug output.
+    """
+
+    __slots__ = ("absolute", "hour", "minute", "second")
+
+    def __init__(self, absolute: bool, hour: int, minute: int = 0,
+                 second: int = 0):
+        self.absolute = absolute
+        self.hour = hour
+        self.minute = minute
+        self.second = second
+
+    def __repr__(self):
+        kind = "abs" if self.absolute else "rel"
+        return f"{kind}time:{self.hour:02}:{self.minute:02}:{self.second:02}"
+
+    def __eq__(self, other):
+        if other.__class__ is not TimeValue:
+            return NotImplemented
+        return (self.absolute == other.absolute and self.hour == other.hour
+                and self.minute == other.minute
+                and self.second == other.second)
+
+    def __hash__(self):
+        return hash((self.absolute, self.hour, self.minute, self.second))
+
+
+class DateValue():
+    """A normalized date, as carried in EToken.date.
+
+    .kind is one of
+        ABS       .year, .month and .day are all known
+        REL       .month and .day are known, but not the year
+        WEEKDAY   .weekday is known (0 = Monday), as in "on Thursday"
+        MONTHDAY  only .day is known, as in "on the 21st"
+
+    Fields that do not apply to the kind are None. Values are shared
+    between tokens, so treat them as immutable. str() gives the old
+    string normal form ("absdate:mm/dd/yyyy", "reldate:mm/dd",
+    "reldate:weekday:n" or "reldate:monthday:n"), which is only meant
+    for debug output.
+    """
+
+    __slots__ = ("kind", "year", "month", "day", "weekday")
+
+    def __init__(self, kind: str, year: int = None, month: int = None,
+                 day: int = None, weekday: int = None):
+        self.kind = kind
+        self.year = year
+        self.month = month
+        self.day = day
+        self.weekday = weekday
+
+    @classmethod
+    def from_date(cls, d: date):
+        """Return the ABS value for the datetime.date d"""
+        return cls(ABS, d.year, d.month, d.day)
+
+    def __repr__(self):
+        if self.kind == ABS:
+            return f"absdate:{self.month:02}/{self.day:02}/{self.year:04}"
+        if self.kind == REL:
+            return f"reldate:{self.month:02}/{self.day:02}"
+        if self.kind == WEEKDAY:
+            return f"reldate:weekday:{self.weekday}"
+        return f"reldate:monthday:{self.day}"
+
+    def __eq__(self, other):
+        if other.__class__ is not DateValue:
+            return NotImplemented
+        return (self.kind == other.kind and self.year == other.year and
+                self.month == other.month and self.day == other.day and
+                self.weekday == other.weekday)
+
+    def __hash__(self):
+        return hash((self.kind, self.year, self.month, self.day,
+                     self.weekday))
@@ -0,0 +1,133 @@
+# parse_cache.py: An in-process cache of event_parser.parse_event() results
+#
+# Copyright (C) 2018 Cardinal Peak LLC
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import re
+import threading
+from collections import OrderedDict
+import event_parser
+
+# Phrases such as "in 20 minutes" are parsed relative to the current
+# time of day, not just the date, so their results cannot be reused.
+# This matches any phrase that mentions minutes or hours.
+clock_relative_re = re.compile(
+    r"\b(?:" + "|".join(event_parser.minute_txt + event_parser.hour_txt) +
+    r")\b", re.IGNORECASE)
+
+
+def normalize_phrase(raw: str) -> str:
+    """Return the cache key form of raw: runs of whitespace folded to a
+    single space, and leading and trailing whitespace removed.
+
+    Case is not folded, because the title and location are returned
+    with their original case, and the tagger treats "May" and "may"
+    differently.
+    """
+    return " ".join(raw.split())
+
+
+class ParseCache():
+    """A bounded, least-recently-used cache in front of
+    event_parser.parse_event().
+
+    Results are keyed by the normalized phrase (see normalize_phrase()),
+    the tagger engine and the reference date of the parse, and the
+    whole cache is cleared when the reference date moves on to a later
+    day. Phrases parsed relative to the time of day ("in 2 hours") and
+    calls with debug set are passed through to parse_event() uncached.
+
+    The result tuples hold only immutable values, so they are shared
+    between callers. A ParseCache may be used from several threads.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.day = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bypasses = 0
+
+    def parse_event(self, raw: str, debug: bool = False, log: bool = False,
+                    tagger: str = None, now=None):
+        """Return event_parser.parse_event(raw, debug, log, tagger, now),
+        from the cache if possible.
+
+        The phrase is logged, as requested by log, even when the result
+        comes from the cache.
+        """
+        now = event_parser.reference_time(now)
+        if debug or clock_relative_re.search(raw):
+            with self.lock:
+                self.bypasses += 1
+            return event_parser.parse_event(raw, debug, log, tagger, now)
+
+        day = now.date()
+        key = (normalize_phrase(raw), tagger or event_parser.tagger_engine,
+               day)
+        with self.lock:
+            if self.day is None or day > self.day:
+                self.entries.clear()
+                self.day = day
+            res = self.entries.get(key)
+            if res is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if res is not None:
+            event_parser.start_parse(raw, debug, log)
+            return res
+
+        res = event_parser.parse_event(raw, debug, log, tagger, now)
+        with self.lock:
+            # only keep results for the cache's current day, which may
+            # have moved on during the parse
+            if day == self.day and self.maxsize > 0:
+                self.entries[key] = res
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+        return res
+
+    def clear(self) -> None:
+        """Empty the cache and reset the statistics."""
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = self.evictions = self.bypasses = 0
+
+    def stats(self) -> dict:
+        """Return a dict of the cache statistics: hits, misses,
+        evictions, bypasses (uncacheable calls), size and maxsize."""
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "bypasses": self.bypasses,
+                    "size": len(self.entries), "maxsize": self.maxsize}
+
+
+# the cache used by parse_event() below
+default_cache = ParseCache()
+
+
+def parse_event(raw: str, debug: bool = False, log: bool = False,
+                tagger: str = None, now=None):
+    """A drop-in replacement for event_parser.parse_event() that uses
+    default_cache."""
+    return default_cache.parse_event(raw, debug, log, tagger, now)
@@ -0,0 +1,242 @@
+# query_log.py: Buffered, rotating log of the phrases parsed
+#
+# Copyright (C) 2018 Cardinal Peak LLC
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import atexit
+import os
+import threading
+import weakref
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class QueryLogger():
+    """Appends lines to a log file from a background thread, so that
+    logging costs the caller no more than adding to a list.
+
+    Lines are buffered in memory and written in batches: once
+    flush_interval seconds have passed since the first line of a batch
+    was logged, or once batch_lines lines are waiting. At most
+    max_buffer lines are held; beyond that, new lines are dropped.
+
+    Before a batch would take the file past max_bytes, the file is
+    rotated: path becomes path.1, path.1 becomes path.2, and so on, up
+    to backups old files. max_bytes of 0 turns rotation off. Processes
+    logging to the same path take turns, through a lock on the file
+    path.lock, to rotate and append, so that two of them never rotate
+    the file at once.
+
+    Errors writing the file, such as a missing directory, are counted
+    in .errors and the batch is dropped; they never reach the caller.
+    Pending lines are written by flush(), by close(), and when the
+    interpreter exits; a process that leaves by os._exit() or a signal
+    must call close() (or close_loggers()) first. In a forked child,
+    the logger starts out empty, with no lines of the parent's to
+    write. The writer thread stops once it has had nothing to write
+    for flush_interval seconds, and is started again by log(), so that
+    it does not keep a logger that is no longer used alive.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 10 << 20,
+                 backups: int = 3, flush_interval: float = 1.0,
+                 batch_lines: int = 1000, max_buffer: int = 100000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.batch_lines = batch_lines
+        self.max_buffer = max_buffer
+        self.pending = []
+        self.cond = threading.Condition()
+        self.thread = None
+        self.writing = False
+        self.flushing = 0
+        self.closing = False
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        live_loggers.add(self)
+
+    def after_fork(self) -> None:
+        """In a newly forked child, drop the parent's pending lines,
+        whose writing is the parent's business, and its writer thread
+        and lock, which the child does not share."""
+        self.cond = threading.Condition()
+        self.pending = []
+        self.thread = None
+        self.writing = False
+        self.flushing = 0
+        self.written = self.dropped = self.errors = 0
+
+    def log(self, line: str) -> None:
+        """Queue line to be written, as a single line."""
+        line = line.replace("\n", " ")
+        with self.cond:
+            if self.closing:
+                return
+            if len(self.pending) >= self.max_buffer:
+                self.dropped += 1
+                return
+            self.pending.append(line)
+            if self.thread is None or not self.thread.is_alive():
+                # started on first use, and again in a forked child,
+                # which does not inherit the parent's thread
+                self.thread = threading.Thread(target=self.run, daemon=True,
+                                               name="query_log writer")
+                self.thread.start()
+            if len(self.pending) >= self.batch_lines:
+                self.cond.notify_all()
+
+    def flush(self, timeout: float = None) -> bool:
+        """Write all pending lines now, waiting up to timeout seconds
+        (default: no limit). Returns True if nothing is left pending."""
+        with self.cond:
+            if self.thread is None:
+                return not self.pending
+            self.flushing += 1
+            self.cond.notify_all()
+            try:
+                return self.cond.wait_for(
+                    lambda: not self.pending and not self.writing, timeout)
+            finally:
+                self.flushing -= 1
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Write all pending lines and stop the writer thread. Lines
+        logged after this are ignored."""
+        with self.cond:
+            self.closing = True
+            self.cond.notify_all()
+            thread = self.thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def stats(self) -> dict:
+        """Return counts of the lines written, dropped (for want of
+        buffer space) and pending, and of write errors."""
+        with self.cond:
+            return {"written": self.written, "dropped": self.dropped,
+                    "pending": len(self.pending), "errors": self.errors}
+
+    def run(self) -> None:
+        """The writer thread: write batches until closed, or idle."""
+        while True:
+            with self.cond:
+                if not self.cond.wait_for(
+                        lambda: self.pending or self.closing,
+                        self.flush_interval):
+                    self.thread = None
+                    return
+                if not self.closing:
+                    # gather a batch, unless someone is waiting on it
+                    self.cond.wait_for(
+                        lambda: (self.closing or self.flushing or
+                                 len(self.pending) >= self.batch_lines),
+                        self.flush_interval)
+                lines = self.pending
+                self.pending = []
+                self.writing = True
+                closing = self.closing
+
+            ok = self.write(lines) if lines else True
+
+            with self.cond:
+                self.writing = False
+                if ok:
+                    self.written += len(lines)
+                else:
+                    self.errors += 1
+                    self.dropped += len(lines)
+                self.cond.notify_all()
+                if closing and not self.pending:
+                    return
+
+    def write(self, lines: list) -> bool:
+        """Append lines to the file, rotating it first if need be.
+        Returns False if the file could not be written."""
+        data = "".join(line + "\n" for line in lines).encode(
+            errors="replace")
+        try:
+            with open(self.path + ".lock", "ab") as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                if self.max_bytes > 0:
+                    try:
+                        size = os.path.getsize(self.path)
+                    except OSError:
+                        size = 0
+                    if size > 0 and size + len(data) > self.max_bytes:
+                        self.rotate()
+                with open(self.path, "ab") as f:
+                    f.write(data)
+        except OSError:
+            return False
+        return True
+
+    def rotate(self) -> None:
+        """Shift path to path.1, path.1 to path.2, and so on, dropping
+        the oldest; with no backups, just start the file again."""
+        if self.backups <= 0:
+            os.remove(self.path)
+            return
+        for i in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{i}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+
+# every QueryLogger in the process, to be closed at exit and reset in a
+# forked child
+live_loggers = weakref.WeakSet()
+
+# loggers made by get_logger(), by path
+loggers = {}
+loggers_lock = threading.Lock()
+
+
+def get_logger(path: str) -> QueryLogger:
+    """Return the QueryLogger for path, with default settings, making
+    it on first use. A process has one logger per path, so that two
+    writer threads never append to the same file."""
+    with loggers_lock:
+        if path not in loggers:
+            loggers[path] = QueryLogger(path)
+        return loggers[path]
+
+
+def close_loggers(timeout: float = 5.0) -> None:
+    """Close every QueryLogger in the process, writing their pending
+    lines, as is done at exit."""
+    for logger in list(live_loggers):
+        logger.close(timeout)
+
+
+def reset_after_fork() -> None:
+    """In a newly forked child, reset every logger inherited from the
+    parent (see QueryLogger.after_fork())."""
+    global loggers_lock
+    loggers_lock = threading.Lock()
+    for logger in list(live_loggers):
+        logger.after_fork()
+
+
+atexit.register(close_loggers)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_after_fork)
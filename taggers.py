@@ -0,0 +1,595 @@
+#!/usr/bin/env python3
+#
+# taggers.py: Part-of-speech tagger engines for event_parser.py
+#
+# Copyright (C) 2018 Cardinal Peak LLC
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import threading
+import time
+from collections import OrderedDict
+
+# Three engines are available, selected by name:
+#
+#   "nltk"        NLTK's averaged perceptron tagger, as used by
+#                 nltk.pos_tag(), with the fast paths of get_tagger()
+#   "lite"        LiteTagger, below
+#   "perceptron"  NLTK's averaged perceptron tagger alone, which gives
+#                 the same tags as "nltk"; see parity_report()
+#
+# All have the NLTK tagger interface: tag(words) returns a list of
+# (word, tag) tuples, and tag_sents(sentences) tags a list of word
+# lists.
+engines = ["nltk", "lite", "perceptron"]
+
+# engines loaded so far, by name
+loaded = {}
+
+# The most word windows the "nltk" engine's WindowCache keeps; 0 tags
+# every sentence with the model. Read when the engine is loaded.
+window_cache_size = 20000
+
+# whether the "nltk" engine tags the words of its tag dictionary before,
+# and without, calling the model; see LexiconTagger. Read when the
+# engine is loaded.
+lexicon_fast_path = True
+
+# Both engines tag left to right, and the tag each gives a word depends
+# on no more than the context_words words either side of it and the
+# tags of the context_words words before it. WindowCache and
+# iter_tags() rely on this.
+context_words = 2
+
+
+def get_tagger(engine: str = "nltk"):
+    """Return the tagger for the named engine, loading it on first use.
+
+    Each engine is loaded once per process; nltk.pos_tag() and
+    nltk.pos_tag_sents(), by contrast, load the NLTK model again on
+    every call. The "nltk" engine is NLTK's perceptron tagger behind a
+    LexiconTagger, unless lexicon_fast_path is False, and that behind a
+    WindowCache, unless window_cache_size is 0; the cache's stats()
+    include the LexiconTagger's, as "tagger".
+    """
+    if engine not in loaded:
+        if engine == "nltk":
+            # imported here, as NLTK is slow to import
+            import nltk
+            tagger = nltk.tag.PerceptronTagger()
+            if lexicon_fast_path and is_perceptron(tagger):
+                tagger = LexiconTagger(tagger)
+            if window_cache_size > 0:
+                tagger = WindowCache(tagger, window_cache_size)
+            loaded[engine] = tagger
+        elif engine == "lite":
+            loaded[engine] = LiteTagger()
+        elif engine == "perceptron":
+            import nltk
+            loaded[engine] = nltk.tag.PerceptronTagger()
+        else:
+            raise ValueError(f"Unknown tagger engine {engine!r}")
+    return loaded[engine]
+
+
+def iter_tags(tagger, words: list, start: int = 0, tags: list = ()):
+    """Yield the tags that tagger.tag(words) gives words[start],
+    words[start + 1], and so on, where tags holds the tags it gives
+    the words before start.
+
+    For LiteTagger and NLTK's perceptron tagger (wrapped in a
+    WindowCache or LexiconTagger or not), tagging starts at
+    words[start], so a caller that stops early does work in proportion
+    to the words it takes. Any other tagger tags the whole sentence.
+    """
+    if isinstance(tagger, WindowCache):
+        tagger = tagger.tagger
+    if hasattr(tagger, "iter_tags"):
+        return tagger.iter_tags(words, start, tags)
+    if is_perceptron(tagger):
+        return perceptron_tags(tagger, words, start, tags)
+    return (tag for (word, tag) in tagger.tag(words)[start:])
+
+
+def is_perceptron(tagger) -> bool:
+    """Return whether tagger is (or works like) NLTK's PerceptronTagger,
+    with a tag dictionary and a model that perceptron_tags() can use."""
+    return hasattr(tagger, "model") and hasattr(tagger, "tagdict")
+
+
+class PerceptronContext():
+    """The normalized words of a sentence, as indexed by NLTK's
+    PerceptronTagger._get_features(): padded with tagger.START and
+    tagger.END, and normalized only when read."""
+
+    def __init__(self, tagger, words: list):
+        self.tagger = tagger
+        self.words = words
+        self.normalized = {}
+
+    def __getitem__(self, i: int) -> str:
+        i -= len(self.tagger.START)
+        if i < 0:
+            return self.tagger.START[i]
+        if i >= len(self.words):
+            return self.tagger.END[i - len(self.words)]
+        if i not in self.normalized:
+            self.normalized[i] = self.tagger.normalize(self.words[i])
+        return self.normalized[i]
+
+
+def perceptron_tags(tagger, words: list, start: int, tags: list):
+    """iter_tags() for NLTK's PerceptronTagger, whose tag() can only
+    start at the beginning of a sentence. This follows the loop in its
+    tag(), starting at words[start]."""
+    prev = tags[start - 1] if start >= 1 else tagger.START[0]
+    prev2 = (tags[start - 2] if start >= 2 else
+             tagger.START[0] if start == 1 else tagger.START[1])
+    context = PerceptronContext(tagger, words)
+    for i in range(start, len(words)):
+        word = words[i]
+        tag = (tagger.tagdict.get(word) or
+               predict_tag(tagger, i, word, context, prev, prev2))
+        yield tag
+        prev2 = prev
+        prev = tag
+
+
+def predict_tag(tagger, i: int, word: str, context, prev: str,
+                prev2: str) -> str:
+    """Return the tag the model of NLTK's PerceptronTagger gives word i
+    of a sentence, given its normalized words, padded as for
+    PerceptronContext, and the tags of the two words before it."""
+    features = tagger._get_features(i, word, context, prev, prev2)
+    tag = tagger.model.predict(features)
+    if isinstance(tag, tuple):
+        # NLTK 3.6 and later return (tag, confidence)
+        tag = tag[0]
+    return tag
+
+
+class LexiconTagger():
+    """Tags each word found in lexicon, a dict mapping words to tags,
+    from there, and only the others with the model of tagger, NLTK's
+    perceptron tagger; a sentence all of whose words are in lexicon
+    never reaches the model.
+
+    For the tags to be the tagger's own, lexicon must only hold words
+    that the tagger tags the same way whatever their context. The
+    default lexicon, and that of the "nltk" engine, is the perceptron's
+    tag dictionary of frequent words that had one tag throughout its
+    training data, such as "at", "on", "from", "tomorrow" and the days
+    of the week. Times, dates and numbers are not in it, since the
+    model tags them by their context, so they always go to the model.
+
+    Statistics are kept per word (hits were tagged from lexicon, misses
+    by the model) and per sentence tagged by tag() or iter_tags(), in
+    whole or from part way through (sentences, of which
+    lexicon_sentences needed no model). A LexiconTagger may be used
+    from several threads.
+    """
+
+    def __init__(self, tagger, lexicon: dict = None):
+        self.tagger = tagger
+        self.lexicon = tagger.tagdict if lexicon is None else lexicon
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.sentences = 0
+        self.lexicon_sentences = 0
+
+    def iter_tags(self, words: list, start: int = 0, tags: list = ()):
+        """Yield the tags of words[start], words[start + 1], and so on,
+        given the tags of the words before start; see iter_tags()"""
+        tagger = self.tagger
+        lexicon = self.lexicon
+        prev = tags[start - 1] if start >= 1 else tagger.START[0]
+        prev2 = (tags[start - 2] if start >= 2 else
+                 tagger.START[0] if start == 1 else tagger.START[1])
+        context = PerceptronContext(tagger, words)
+        hits = misses = 0
+        try:
+            for i in range(start, len(words)):
+                word = words[i]
+                tag = lexicon.get(word)
+                if tag:
+                    hits += 1
+                else:
+                    tag = predict_tag(tagger, i, word, context, prev, prev2)
+                    misses += 1
+                yield tag
+                prev2 = prev
+                prev = tag
+        finally:
+            with self.lock:
+                self.hits += hits
+                self.misses += misses
+                self.sentences += 1
+                self.lexicon_sentences += not misses
+
+    def tag(self, words: list) -> list:
+        """Tag a list of words, returning a list of (word, tag) tuples"""
+        tagger = self.tagger
+        tags = [self.lexicon.get(word) for word in words]
+        misses = tags.count(None)
+        if misses:
+            # the loop of PerceptronTagger.tag(), for the words left
+            context = (tagger.START + [tagger.normalize(word)
+                                       for word in words] + tagger.END)
+            (prev, prev2) = tagger.START
+            for (i, word) in enumerate(words):
+                tag = tags[i]
+                if not tag:
+                    tag = predict_tag(tagger, i, word, context, prev, prev2)
+                    tags[i] = tag
+                prev2 = prev
+                prev = tag
+        with self.lock:
+            self.hits += len(words) - misses
+            self.misses += misses
+            self.sentences += 1
+            self.lexicon_sentences += not misses
+        return list(zip(words, tags))
+
+    def tag_sents(self, sentences: list) -> list:
+        """Tag a list of word lists"""
+        return [self.tag(words) for words in sentences]
+
+    def clear(self) -> None:
+        """Reset the statistics."""
+        with self.lock:
+            self.hits = self.misses = 0
+            self.sentences = self.lexicon_sentences = 0
+
+    def stats(self) -> dict:
+        """Return a dict of the statistics: hits, misses, hit_rate (the
+        fraction of words tagged from lexicon, 0.0 before any),
+        sentences and lexicon_sentences."""
+        with self.lock:
+            words = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / words if words else 0.0,
+                    "sentences": self.sentences,
+                    "lexicon_sentences": self.lexicon_sentences}
+
+
+class WindowCache():
+    """A bounded, least-recently-used cache of tags in front of a
+    tagger that tags left to right, such as NLTK's perceptron tagger,
+    whose tag for a word depends only on the words from before words
+    back to after words ahead, and on the tags of the prev_tags words
+    before it.
+
+    Each word's tag is cached under that window of words (marked where
+    it runs past either end of the sentence) and those previous tags,
+    so a sentence all of whose windows have been seen is tagged from
+    the cache alone. Otherwise the words from the first unseen window
+    on are tagged by the tagger, through iter_tags(), starting there,
+    and their windows are added to the cache. Either way, the tags are
+    the same as the tagger's own.
+
+    Statistics are kept per sentence: hits were tagged from the cache
+    alone, misses in part by the tagger. A WindowCache may be used
+    from several threads.
+    """
+
+    def __init__(self, tagger, maxsize: int = 20000,
+                 before: int = context_words, after: int = context_words,
+                 prev_tags: int = context_words):
+        self.tagger = tagger
+        self.maxsize = maxsize
+        self.before = before
+        self.after = after
+        self.prev_tags = prev_tags
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, padded: list, tags: list, i: int) -> tuple:
+        """Return the cache key of word i of a sentence, given the
+        sentence padded with before Nones at the start and after Nones
+        at the end, and the tags of (at least) the words before i."""
+        return (tuple(padded[i:i + self.before + 1 + self.after]),
+                tuple(tags[max(i - self.prev_tags, 0):i]))
+
+    def tag(self, words: list) -> list:
+        """Tag a list of words, returning a list of (word, tag) tuples"""
+        words = list(words)
+        padded = [None] * self.before + words + [None] * self.after
+        tags = []
+        with self.lock:
+            for i in range(len(words)):
+                key = self.key(padded, tags, i)
+                tag = self.entries.get(key)
+                if tag is None:
+                    break
+                self.entries.move_to_end(key)
+                tags.append(tag)
+            else:
+                self.hits += 1
+                return list(zip(words, tags))
+            self.misses += 1
+
+        # tag from the first miss on, given the tags before it
+        first = len(tags)
+        tags += list(iter_tags(self.tagger, words, first, tags))
+        with self.lock:
+            for i in range(first, len(words)):
+                key = self.key(padded, tags, i)
+                self.entries[key] = tags[i]
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return list(zip(words, tags))
+
+    def tag_sents(self, sentences: list) -> list:
+        """Tag a list of word lists"""
+        return [self.tag(words) for words in sentences]
+
+    def clear(self) -> None:
+        """Empty the cache and reset the statistics, and those of the
+        tagger, if it keeps any."""
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = self.evictions = 0
+        if hasattr(self.tagger, "clear"):
+            self.tagger.clear()
+
+    def stats(self) -> dict:
+        """Return a dict of the cache statistics: hits, misses,
+        evictions, size (in words) and maxsize, and the tagger's own
+        stats(), if it has any, as tagger."""
+        with self.lock:
+            stats = {"hits": self.hits, "misses": self.misses,
+                     "evictions": self.evictions, "size": len(self.entries),
+                     "maxsize": self.maxsize}
+        if hasattr(self.tagger, "stats"):
+            stats["tagger"] = self.tagger.stats()
+        return stats
+
+
+# Closed-class and calendar words, and the tag LiteTagger gives them.
+# Keys are lower case.
+lexicon = {}
+for tag, words in [
+        ("IN", "at in on from with of for after before by about near "
+               "during until til till thru through over into onto "
+               "between around across without within since than "
+               "because if while w/ @ per via like unlike upon"),
+        ("DT", "the a an this that these those every each all some any "
+               "no another either neither"),
+        ("TO", "to"),
+        ("CC", "and or but nor plus"),
+        ("PRP", "i me you he him she her it we us they them myself "
+                "yourself ourselves themselves"),
+        ("PRP$", "my your his its our their"),
+        ("MD", "will would can could shall should may might must"),
+        ("VBZ", "is has does goes starts lasts ends begins"),
+        ("VBP", "are have do"),
+        ("VBD", "was were had did"),
+        ("VB", "be meet call discuss review see pick drop go visit "
+               "take talk play do get make watch grab catch bring "
+               "attend celebrate buy let apologize set bake use"),
+        ("VBN", "been"),
+        ("RB", "not very also up down out off back then there here "
+               "again now soon later early late"),
+        ("WRB", "when where how why"),
+        ("WP", "who what"),
+        ("JJ", "next last big new old good great little free final "
+               "open high"),
+        ("NN", "today tomorrow tonight yesterday noon midnight "
+               "morning afternoon evening night day week month year "
+               "hour minute lunch dinner breakfast brunch coffee "
+               "meeting birthday party"),
+        ("NNS", "days weeks months years hours minutes mins hrs"),
+        ("NNP", "monday tuesday wednesday thursday friday saturday "
+                "sunday january february march april june july "
+                "august september october november december")]:
+    for w in words.split():
+        lexicon[w] = tag
+
+# punctuation tokens, which are their own tags
+punctuation = {",": ",", ".": ".", ":": ":", ";": ":", "-": ":",
+               "--": ":", "!": ".", "?": ".", "(": "(", ")": ")",
+               "``": "``", "''": "''", "'": "''", "$": "$", "#": "#"}
+
+# (suffix, tag) for lower case words not in the lexicon, longest first
+suffixes = [("ing", "VBG"), ("ous", "JJ"), ("ful", "JJ"), ("ive", "JJ"),
+            ("able", "JJ"), ("ible", "JJ"), ("al", "JJ"), ("ly", "RB"),
+            ("ed", "VBD"), ("ss", "NN"), ("s", "NNS")]
+
+# -ing words that are nouns, not verbs
+ing_nouns = {"meeting", "morning", "evening", "wedding", "building",
+             "training", "outing", "offering", "painting", "ceiling"}
+
+
+class LiteTagger():
+    """A small tagger that assigns Penn Treebank tags from a lexicon of
+    closed-class and calendar words, plus spelling heuristics for
+    everything else, with no model to load.
+
+    The rules in event_parser.py only look at a handful of tags (CD,
+    IN, DT, TO, NN*, JJ*, POS, PRP, PRP$ and the comma), and they
+    mostly care whether a word can continue a noun phrase; this tagger
+    aims to get those right rather than to match NLTK tag for tag.
+    See parity_report() for how closely it does.
+    """
+
+    def tag_word(self, word: str, prev: str, prev_tag: str) -> str:
+        """Return the tag for word, given the previous word and its tag
+        (both None at the start of the sentence)."""
+        if word in punctuation:
+            return punctuation[word]
+        if word in ("'s", "'S"):
+            return "POS"
+        if word[0].isdigit():
+            return "CD"
+        lower = word.lower()
+        if lower in lexicon:
+            # "May" is the month unless it is a modal verb: "we may go"
+            if lower == "may" and (prev_tag == "IN" or
+                                   (word[0].isupper() and prev is not None)):
+                return "NNP"
+            return lexicon[lower]
+        if not word[0].isalpha():
+            return "SYM"
+        if word[0].isupper():
+            return "NNP"
+        # bare verb after "to" or a modal: "to discuss", "will go"
+        if prev_tag in ("TO", "MD"):
+            return "VB"
+        if lower in ing_nouns:
+            return "NN"
+        for (suffix, tag) in suffixes:
+            if lower.endswith(suffix) and len(lower) > len(suffix) + 1:
+                return tag
+        return "NN"
+
+    def iter_tags(self, words: list, start: int = 0, tags: list = ()):
+        """Yield the tags of words[start], words[start + 1], and so on,
+        given the tags of the words before start; see iter_tags()"""
+        prev = words[start - 1] if start >= 1 else None
+        prev_tag = tags[start - 1] if start >= 1 else None
+        for i in range(start, len(words)):
+            tag = self.tag_word(words[i], prev, prev_tag)
+            yield tag
+            prev = words[i]
+            prev_tag = tag
+
+    def tag(self, words: list) -> list:
+        """Tag a list of words, returning a list of (word, tag) tuples"""
+        return list(zip(words, self.iter_tags(words)))
+
+    def tag_sents(self, sentences: list) -> list:
+        """Tag a list of word lists"""
+        return [self.tag(words) for words in sentences]
+
+
+# Tags that the rules in event_parser.py distinguish. For the parity
+# report, any other tag is counted as "other".
+rule_tags = {"CD", "IN", "DT", "TO", "NN", "NNS", "NNP", "NNPS", "JJ",
+             "JJR", "JJS", "POS", "PRP", "PRP$", ","}
+
+
+def parse_or_none(raw: str, engine: str):
+    """Return event_parser.parse_event(raw) using the named tagger
+    engine, or None if the parser raises an exception."""
+    import event_parser
+    try:
+        return event_parser.parse_event(raw, tagger=engine)
+    except Exception:
+        return None
+
+
+def parity_report(cases: list = None, engine: str = "lite",
+                  reference: str = "nltk") -> dict:
+    """Compare a tagger engine with a reference engine.
+
+    cases defaults to testdata.testdata; each case is a tuple whose
+    first element is the phrase, followed by the expected parse_event()
+    result. Returns a dict with:
+
+    tag_agreement
+        the fraction of words given the same tag by both engines
+    rule_tag_agreement
+        the same, where all tags outside rule_tags count as equal
+    parse_agreement
+        the fraction of phrases that parse_event() parses identically
+        with either engine
+    accuracy
+        for each engine, the fraction of phrases parsed exactly as
+        expected
+    tag_seconds
+        for each engine, the mean time to tag one phrase, in seconds
+    """
+    import event_parser
+
+    if cases is None:
+        from testdata import testdata
+        cases = testdata
+
+    sents = [event_parser.word_tokenize(case[0]) for case in cases]
+    report = {"phrases": len(cases), "accuracy": {}, "tag_seconds": {}}
+    tagged = {}
+    results = {}
+    for name in (engine, reference):
+        tagger = get_tagger(name)
+        start = time.perf_counter()
+        tagged[name] = [tagger.tag(words) for words in sents]
+        report["tag_seconds"][name] = ((time.perf_counter() - start) /
+                                       max(len(sents), 1))
+        results[name] = [parse_or_none(case[0], name) for case in cases]
+        correct = sum(res is not None and tuple(res) == tuple(case[1:7])
+                      for (res, case) in zip(results[name], cases))
+        report["accuracy"][name] = correct / max(len(cases), 1)
+
+    words = same = rule_same = 0
+    for (ours, theirs) in zip(tagged[engine], tagged[reference]):
+        for ((w, a), (w2, b)) in zip(ours, theirs):
+            words += 1
+            same += (a == b)
+            rule_same += (a == b or (a not in rule_tags and
+                                     b not in rule_tags))
+    report["tag_agreement"] = same / max(words, 1)
+    report["rule_tag_agreement"] = rule_same / max(words, 1)
+    agree = sum(a == b for (a, b) in zip(results[engine], results[reference]))
+    report["parse_agreement"] = agree / max(len(cases), 1)
+    return report
+
+
+def tagdict_coverage(cases: list = None, tagger=None) -> dict:
+    """Report how much of the phrases of cases (default:
+    testdata.testdata) NLTK's perceptron tagger (default: that of the
+    "nltk" engine) tags from its tag dictionary, without the model.
+    Returns a dict with:
+
+    words
+        the fraction of words in the tag dictionary
+    sentences
+        the fraction of phrases all of whose words are
+    """
+    import event_parser
+
+    if cases is None:
+        from testdata import testdata
+        cases = testdata
+    if tagger is None:
+        tagger = get_tagger("nltk")
+    while isinstance(tagger, (WindowCache, LexiconTagger)):
+        tagger = tagger.tagger
+
+    sents = [event_parser.word_tokenize(case[0]) for case in cases]
+    words = sum(map(len, sents))
+    known = sum(word in tagger.tagdict for words in sents for word in words)
+    whole = sum(all(word in tagger.tagdict for word in words)
+                for words in sents)
+    return {"words": known / max(words, 1),
+            "sentences": whole / max(len(sents), 1)}
+
+
+if __name__ == '__main__':
+    report = parity_report()
+    print(f"{report['phrases']} phrases")
+    print(f"tag agreement: {report['tag_agreement']:.1%} "
+          f"(on rule tags: {report['rule_tag_agreement']:.1%})")
+    print(f"parse agreement: {report['parse_agreement']:.1%}")
+    for name in report["accuracy"]:
+        print(f"{name}: accuracy {report['accuracy'][name]:.1%}, "
+              f"{report['tag_seconds'][name] * 1e6:.0f} us/phrase to tag")
+    coverage = tagdict_coverage()
+    print(f"nltk tag dictionary: {coverage['words']:.1%} of words, "
+          f"{coverage['sentences']:.1%} of phrases")
@@ -22,9 +22,13 @@
 
 from datetime import date, time, timedelta, datetime
 from dateutil import relativedelta
-today = date.today()
-tomorrow = date.today() + timedelta(days=1)
-yesterday = date.today() - timedelta(days=1)
+# The expected results below are relative to this time, read once at
+# import; pass it to parse_event() as now to compare against them
+# exactly.
+now = datetime.now()
+today = now.date()
+tomorrow = today + timedelta(days=1)
+yesterday = today - timedelta(days=1)
 
 
 def weekday_to_num(s: str) -> int:
@@ -97,8 +101,7 @@ def next_day(mon: int, day: int) -> date:
 
 
 def in_x_min(minutes: int) -> time:
-    """Return a time that is the specified minutes in the future"""
-    now = datetime.now()
+    """Return a time that is the specified minutes after now"""
     tm = (now + timedelta(minutes=minutes)).time()
     return tm.replace(second=0, microsecond=0)
 
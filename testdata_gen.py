@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+#
+# testdata_gen.py: Generates synthetic test phrases, with their expected
+# parses
+#
+# Copyright (C) 2018 Cardinal Peak LLC
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Phrases are put together from a title and, each maybe, a location, a
+# date (or date range) and a time (or time range, or time and duration),
+# in one of several orders. Only forms whose parse follows from the
+# parts are generated: times are given with am / pm, in 24 hour form or
+# as noon, so none depends on the parser's guess at the time of day, and
+# nothing is relative to the clock time. So each phrase comes with its
+# expected parse, relative to a fixed reference time.
+#
+# The output is a corpus for event_parser_eval.py, or with --phrases one
+# phrase per line, for event_parser.py --batch. The same seed and
+# reference time always give the same output.
+
+import argparse
+import calendar
+import json
+import random
+import sys
+from datetime import date, time, datetime, timedelta
+import event_parser
+from event_parser_bench import reference
+
+titles = ["Lunch with Kate", "Team meeting", "Dentist appointment",
+          "Soccer practice", "Coffee with Sam", "Book club", "Piano lesson",
+          "Yoga class", "Project review", "Dinner with the Smiths",
+          "Haircut", "Call with Jordan", "Staff meeting", "Bike ride",
+          "Study group", "Parent teacher conference", "Grocery shopping"]
+
+# places, given with "at", and towns, given with "in"
+places = ["Starbucks", "the Corner Cafe", "Lucky's", "City Hall",
+          "the Marriott Hotel", "Rayback Collective", "JFK High School",
+          "Nordstroms", "the library", "Room 321"]
+towns = ["Cupertino", "Boulder", "Denver", "Mexico"]
+
+# the parts of a phrase, in the orders they are put together
+orders = [("title", "location", "date", "time"),
+          ("title", "date", "time", "location"),
+          ("title", "time", "date", "location"),
+          ("date", "title", "time", "location"),
+          ("title", "location", "time", "date")]
+
+ordinal_suffix = {1: "st", 2: "nd", 3: "rd", 21: "st", 22: "nd", 23: "rd"}
+
+
+def next_weekday(today: date, wd: int) -> date:
+    """Return the next date, 1 to 7 days after today, that falls on
+    weekday wd (0 for Monday)"""
+    return today + timedelta(days=(wd - today.weekday() - 1) % 7 + 1)
+
+
+def next_date(today: date, mon: int, day: int) -> date:
+    """Return the next date, from today on, that is the given month and
+    day"""
+    d = date(today.year, mon, day)
+    return d if d >= today else date(today.year + 1, mon, day)
+
+
+def ordinal(day: int) -> str:
+    """Return day with its ordinal suffix ("3rd")"""
+    return f"{day}{ordinal_suffix.get(day, 'th')}"
+
+
+def gen_date(rng: random.Random, today: date) -> tuple:
+    """Return a random date phrase, with its start and end dates."""
+    form = rng.randrange(6)
+    if form == 0:
+        wd = rng.randrange(7)
+        name = calendar.day_name[wd]
+        text = rng.choice([name, name.lower(), f"on {name}", f"next {name}"])
+        d = next_weekday(today, wd)
+        return (text, d, d)
+    if form == 1:
+        (text, days) = rng.choice([("today", 0), ("tomorrow", 1)])
+        d = today + timedelta(days=days)
+        return (text, d, d)
+
+    mon = rng.randint(1, 12)
+    day = rng.randint(1, 28)
+    if form == 2:
+        name = calendar.month_name[mon]
+        text = rng.choice([f"{name} {day}", f"{name} {ordinal(day)}",
+                           f"on {name} {day}",
+                           f"{day} {calendar.month_abbr[mon]}"])
+        d = next_date(today, mon, day)
+        return (text, d, d)
+    if form == 3:
+        if rng.randrange(2):
+            year = today.year + rng.randint(0, 2)
+            d = date(year, mon, day)
+            text = rng.choice([f"{mon}/{day}/{year}", f"{mon}-{day}-{year}"])
+        else:
+            d = next_date(today, mon, day)
+            text = rng.choice([f"{mon}/{day}", f"on {mon}/{day}"])
+        return (text, d, d)
+    if form == 4:
+        # a range of days within one month
+        last = rng.randint(day + 1, 28) if day < 28 else 28
+        day = min(day, last - 1)
+        name = calendar.month_name[mon]
+        text = rng.choice([f"from {mon}/{day} - {mon}/{last}",
+                           f"from {mon}/{day} to {mon}/{last}",
+                           f"from {name} {ordinal(day)} - {ordinal(last)}",
+                           f"from {name} {day} - {last}"])
+        d = next_date(today, mon, day)
+        return (text, d, d + timedelta(days=last - day))
+    # a range of weekdays
+    wd = rng.randrange(7)
+    span = rng.randint(1, 6)
+    text = (f"{calendar.day_name[wd]} to "
+            f"{calendar.day_name[(wd + span) % 7]}")
+    d = next_weekday(today, wd)
+    return (text, d, d + timedelta(days=span))
+
+
+def clock(t: time, rng: random.Random) -> str:
+    """Return a random way of writing the time t, which is not noon, with
+    am / pm or in 24 hour form"""
+    hour = t.hour % 12 or 12
+    ampm = "pm" if t.hour >= 12 else "am"
+    if t.minute:
+        forms = [f"{hour}:{t.minute:02}{ampm}", f"{hour}:{t.minute:02} {ampm}"]
+    else:
+        forms = [f"{hour}{ampm}", f"{hour} {ampm}", f"{hour}:00 {ampm}"]
+    if t.hour > 12:
+        forms.append(f"{t.hour}:{t.minute:02}")
+    return rng.choice(forms)
+
+
+def gen_time(rng: random.Random, duration: bool = True) -> tuple:
+    """Return a random time phrase, with its start and end times. If
+    duration is false, the phrase is not a time and duration ("at 9am
+    for 2 hours"), whose end would also end a range of dates."""
+    start = time(rng.randint(7, 19), rng.choice([0, 0, 0, 15, 30, 45]))
+    form = rng.randrange(4) if duration else rng.choice([0, 2, 3])
+    text = "noon" if start == time(12) else clock(start, rng)
+    if form == 0:
+        return (rng.choice([f"at {text}", f"@ {text}", f"@{text}"]),
+                start, None)
+
+    minutes = rng.choice([30, 45, 60, 90, 120, 180])
+    end = (datetime.combine(date.min, start) +
+           timedelta(minutes=minutes)).time()
+    if form == 1:
+        if minutes % 60:
+            dur = rng.choice([f"{minutes} minutes", f"{minutes} min"])
+        else:
+            hours = minutes // 60
+            dur = f"{hours} hour" if hours == 1 else f"{hours} hours"
+        if minutes == 90:
+            dur = rng.choice([dur, "1.5 hours"])
+        return (f"at {text} for {dur}", start, end)
+
+    end_text = "noon" if end == time(12) else clock(end, rng)
+    if form == 2:
+        return (f"from {text} to {end_text}", start, end)
+    return (f"from {text} - {end_text}", start, end)
+
+
+def gen_location(rng: random.Random) -> tuple:
+    """Return a random location phrase, with the location."""
+    if rng.randrange(4):
+        place = rng.choice(places)
+        return (f"at {place}", place)
+    town = rng.choice(towns)
+    return (f"in {town}", town)
+
+
+def gen_case(rng: random.Random, now: datetime = reference) -> dict:
+    """Return a random case, in the corpus format of event_parser_eval.py:
+    a phrase, its expected parse relative to now, and now."""
+    title = rng.choice(titles)
+    parts = {"title": title}
+    event = [None, None, None, None, title, None]
+    if rng.random() < 0.8:
+        (parts["date"], event[0], event[1]) = gen_date(rng, now.date())
+    if rng.random() < 0.8:
+        (parts["time"], event[2], event[3]) = gen_time(
+            rng, event[0] == event[1])
+    if rng.random() < 0.6:
+        (parts["location"], event[5]) = gen_location(rng)
+    order = rng.choice(orders)
+    text = " ".join(parts[part] for part in order if part in parts)
+    return {"text": text, "expected": event_parser.event_to_dict(event),
+            "now": now.isoformat()}
+
+
+def generate(n: int = None, seed: int = 0, now: datetime = reference):
+    """Yield n random cases (forever, if n is None), as gen_case() makes
+    them. The same seed and now always give the same cases."""
+    rng = random.Random(seed)
+    i = 0
+    while n is None or i < n:
+        yield gen_case(rng, now)
+        i += 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic test phrases, with their expected "
+        "parses")
+    parser.add_argument("count", type=int, help="number of phrases")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="random seed (default: 0)")
+    parser.add_argument("--now", type=datetime.fromisoformat,
+                        default=reference,
+                        help="reference time of the expected parses "
+                        f"(default: {reference.isoformat()})")
+    parser.add_argument("--phrases", action="store_true",
+                        help="write only the phrases, one per line")
+    parser.add_argument("--output", "-o", metavar="FILE",
+                        help="output file (default: stdout)")
+    args = parser.parse_args()
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for case in generate(args.count, args.seed, args.now):
+            if args.phrases:
+                out.write(case["text"] + "\n")
+            else:
+                out.write(json.dumps(case) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()